@@ -0,0 +1,264 @@
+"""Load benchmark against the offline Major API and Telegram stand-ins.
+
+    python -m bot.benchmark --sessions 500 --duration 120
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import aiohttp
+
+from bot.config import settings
+from bot.utils import logger, clock, metrics
+from bot.utils.profiler import profile_window
+from bot.core.tapper import Tapper, youtube_answer_provider
+from bot.core.scheduler import CycleScheduler
+from bot.core.connections import connectors
+from bot.core.telegram import tg_connections, SessionDescriptor
+from bot.core.ledger import task_ledger
+from .mock_api import MockMajorApi, MockConfig
+from .fake_telegram import FakeSessionDescriptor
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def rss_mb() -> float:
+    return metrics.rss_bytes() / 1024 / 1024
+
+
+class RequestTimer:
+    def __init__(self):
+        self.durations = []
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_start)
+        self.trace_config.on_request_end.append(self._on_end)
+        self.trace_config.on_request_exception.append(self._on_exception)
+
+    async def _on_start(self, session, context, params):
+        # bot time stands still while a request is on the wire
+        context.clock = clock.current()
+        context.clock.acquire()
+        context.started = time.perf_counter()
+
+    async def _on_end(self, session, context, params):
+        self.durations.append(time.perf_counter() - context.started)
+        context.clock.release()
+
+    async def _on_exception(self, session, context, params):
+        context.clock.release()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bot.benchmark')
+    parser.add_argument('-n', '--sessions', type=int, default=100, help='Simulated sessions')
+    parser.add_argument('-d', '--duration', type=float, default=60, help='Run time in seconds')
+    parser.add_argument('-c', '--concurrency', type=int, default=settings.MAX_CONCURRENT_CYCLES,
+                        help='MAX_CONCURRENT_CYCLES for the run')
+    parser.add_argument('--latency', type=float, default=50, help='Mock API latency, ms')
+    parser.add_argument('--tg-latency', type=float, default=50, help='Fake Telegram call latency, ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--cooldown', type=int, default=8 * 3600, help='Mini-game cooldown, seconds')
+    parser.add_argument('--sleep', type=int, default=5, help='SLEEP_TIME between cycles, seconds')
+    parser.add_argument('--virtual-time', action='store_true',
+                        help='Run bot sleeps on a virtual clock; --duration is then simulated seconds')
+    parser.add_argument('--low-memory', action='store_true', help='Run with LOW_MEMORY enabled')
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help='Profile the event loop (bot and mock API) for the first SECONDS of the run')
+    parser.add_argument('--memory', action='store_true',
+                        help='Only measure RSS per idle session (Pyrogram Client vs descriptor), no load run')
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace, base_url: str, state_dir: str) -> None:
+    settings.API_BASE_URL = base_url
+    settings.STATE_DIR = os.path.join(state_dir, 'state')
+    settings.SCHEDULE_FILE = os.path.join(state_dir, 'schedule.json')
+    settings.TASK_LEDGER_PATH = os.path.join(state_dir, 'ledger.db')
+    settings.MAX_CONCURRENT_CYCLES = args.concurrency
+    settings.SLEEP_TIME = [args.sleep, args.sleep]
+    settings.USE_RANDOM_DELAY_IN_RUN = False
+    settings.LOW_MEMORY = args.low_memory
+    youtube_answer_provider.url = f"{base_url}/answers"
+
+
+STALL_TIMEOUT = 30
+
+
+async def wait_simulated(scheduler_task: asyncio.Task, duration: float) -> None:
+    """Waits for ``duration`` of virtual time; fails if it stops moving for STALL_TIMEOUT real seconds."""
+    finish = clock.time() + duration
+    last_time, last_moved = clock.time(), time.perf_counter()
+    while clock.time() < finish and not scheduler_task.done():
+        await asyncio.sleep(0.05)
+        if clock.time() != last_time:
+            last_time, last_moved = clock.time(), time.perf_counter()
+        elif time.perf_counter() - last_moved > STALL_TIMEOUT:
+            raise RuntimeError(f"Virtual time stuck at +{last_time - finish + duration:.3f}s "
+                               f"for {STALL_TIMEOUT}s of real time")
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    driver_task = None
+    if args.virtual_time:
+        virtual_clock = clock.VirtualClock()
+        clock.use(virtual_clock)
+        driver_task = asyncio.create_task(virtual_clock.run())
+
+    api = MockMajorApi(MockConfig(
+        latency=args.latency / 1000,
+        latency_jitter=args.latency / 4000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        game_cooldown=args.cooldown,
+    ))
+    base_url = await api.start()
+    state_dir = tempfile.mkdtemp(prefix='majorbot-bench-')
+    configure(args, base_url, state_dir)
+
+    timer = RequestTimer()
+    connectors.extra_trace_configs.append(timer.trace_config)
+
+    rss_before = rss_mb()
+    clients = [
+        FakeSessionDescriptor(name=f"bench_{index}", user_id=10_000_000 + index, latency=args.tg_latency / 1000)
+        for index in range(args.sessions)
+    ]
+    tappers = [Tapper(tg_client=client, proxy=None) for client in clients]
+    scheduler = CycleScheduler(tappers=tappers, max_concurrent=args.concurrency, state_file=settings.SCHEDULE_FILE)
+
+    monitor = metrics.LoopLagMonitor(history=None)
+    monitor_task = asyncio.create_task(monitor.run())
+    scheduler_task = asyncio.create_task(scheduler.run())
+    profiler_task = asyncio.create_task(profile_window(args.profile)) if args.profile else None
+    started = time.perf_counter()
+    simulated_start = clock.time()
+
+    if args.virtual_time:
+        await wait_simulated(scheduler_task, args.duration)
+    else:
+        try:
+            await asyncio.wait_for(asyncio.shield(scheduler_task), timeout=args.duration)
+        except asyncio.TimeoutError:
+            pass
+    elapsed = time.perf_counter() - started
+    simulated = clock.time() - simulated_start
+    rss_after = rss_mb()
+
+    tasks = [task for task in (scheduler_task, monitor_task, profiler_task) if task]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    for tapper in tappers:
+        await tapper.close()
+    await connectors.close()
+    await tg_connections.close()
+    task_ledger.close()
+    await api.stop()
+    shutil.rmtree(state_dir, ignore_errors=True)
+
+    if driver_task:
+        driver_task.cancel()
+        clock.use(clock.RealClock())
+
+    return dict(
+        sessions=args.sessions,
+        elapsed=elapsed,
+        simulated=simulated,
+        cycles=scheduler.cycles,
+        cycles_per_sec=scheduler.cycles / elapsed if elapsed else 0.0,
+        requests=len(timer.durations),
+        api_errors=api.errors,
+        tg_calls=sum(client.calls for client in clients),
+        latency_p50=percentile(timer.durations, 50) * 1000,
+        latency_p99=percentile(timer.durations, 99) * 1000,
+        rss_mb=rss_after,
+        rss_per_session_kb=(rss_after - rss_before) * 1024 / max(1, args.sessions),
+        loop_lag_p50=percentile(monitor.samples, 50) * 1000,
+        loop_lag_p99=percentile(monitor.samples, 99) * 1000,
+        loop_lag_max=max(monitor.samples, default=0.0) * 1000,
+        stage_time=metrics.stage_breakdown(limit=10),
+    )
+
+
+async def measure_memory(args: argparse.Namespace) -> dict:
+    """RSS growth per idle session for each way a session can sit between cycles."""
+    state_dir = tempfile.mkdtemp(prefix='majorbot-bench-')
+    settings.STATE_DIR = os.path.join(state_dir, 'state')
+    result = dict(sessions=args.sessions)
+
+    def per_session_kb(before: float) -> float:
+        return (rss_mb() - before) * 1024 / max(1, args.sessions)
+
+    # cheapest first, RSS rarely shrinks after objects are freed
+    before = rss_mb()
+    tappers = [Tapper(tg_client=SessionDescriptor(name=f"bench_{index}"), proxy=None) for index in range(args.sessions)]
+    result['descriptor_kb'] = per_session_kb(before)
+
+    before = rss_mb()
+    for tapper in tappers:
+        tapper.get_http_client()
+    result['http_session_kb'] = per_session_kb(before)
+
+    before = rss_mb()
+    clients = [tapper.tg_session.create_client() for tapper in tappers]
+    result['client_kb'] = per_session_kb(before)
+
+    for tapper in tappers:
+        await tapper.close()
+    await connectors.close()
+    del clients
+    shutil.rmtree(state_dir, ignore_errors=True)
+    result['rss_mb'] = rss_mb()
+    return result
+
+
+def report_memory(result: dict) -> None:
+    logger.info(
+        f"Memory | Sessions: <y>{result['sessions']}</y> | Idle Tapper with descriptor: "
+        f"<y>{result['descriptor_kb']:.1f} KB</y> | + HTTP session kept between cycles: "
+        f"<y>{result['http_session_kb']:.1f} KB</y> | + Pyrogram Client: <y>{result['client_kb']:.1f} KB</y> "
+        f"| RSS: <y>{result['rss_mb']:.1f} MB</y>"
+    )
+
+
+def report(result: dict) -> None:
+    logger.info(
+        f"Benchmark | Sessions: <y>{result['sessions']}</y> | Time: <y>{result['elapsed']:.1f}s</y> "
+        f"(bot time <y>{result['simulated']:.0f}s</y>) "
+        f"| Cycles: <y>{result['cycles']}</y> (<y>{result['cycles_per_sec']:.2f}/s</y>)"
+    )
+    logger.info(
+        f"Benchmark | Requests: <y>{result['requests']}</y> | API errors: <y>{result['api_errors']}</y> "
+        f"| Telegram calls: <y>{result['tg_calls']}</y> "
+        f"| Latency p50/p99: <y>{result['latency_p50']:.1f}/{result['latency_p99']:.1f} ms</y>"
+    )
+    logger.info(
+        f"Benchmark | RSS: <y>{result['rss_mb']:.1f} MB</y> (<y>{result['rss_per_session_kb']:.1f} KB</y> per session) "
+        f"| Loop lag p50/p99/max: <y>{result['loop_lag_p50']:.1f}/{result['loop_lag_p99']:.1f}/{result['loop_lag_max']:.1f} ms</y>"
+    )
+    logger.info(f"Benchmark | Stage time: <y>{result['stage_time']}</y>")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.memory:
+        report_memory(asyncio.run(measure_memory(args)))
+        return
+
+    result = asyncio.run(run_benchmark(args))
+    report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from urllib.parse import quote, urlencode
+
+from pyrogram.raw.types import InputPeerUser
+
+from bot.utils import clock
+from bot.core.telegram import SessionDescriptor
+
+
+BOT_ID = 5000000001
+
+
+class FakeTelegramClient:
+    """Pyrogram Client stand-in covering the calls Tapper makes."""
+
+    def __init__(self, name: str, user_id: int, latency: float = 0.05, session=None):
+        self.name = name
+        self.user_id = user_id
+        self.latency = latency
+        self.session = session or self
+        self.proxy = None
+        self.is_connected = False
+        self.calls = 0
+
+    async def _call(self) -> None:
+        self.session.calls += 1
+        with clock.hold():
+            await asyncio.sleep(self.latency)
+
+    async def connect(self) -> bool:
+        await self._call()
+        self.is_connected = True
+        return True
+
+    async def disconnect(self) -> None:
+        await self._call()
+        self.is_connected = False
+
+    async def resolve_peer(self, peer_id):
+        await self._call()
+        if peer_id == 'major':
+            return InputPeerUser(user_id=BOT_ID, access_hash=BOT_ID * 7)
+        return InputPeerUser(user_id=int(peer_id), access_hash=0)
+
+    def _init_data(self) -> str:
+        user = json.dumps({"id": self.user_id, "first_name": self.name}, separators=(',', ':'))
+        return urlencode({
+            "query_id": f"AA{self.user_id}",
+            "user": user,
+            "auth_date": int(clock.time()),
+            "hash": "mock",
+        })
+
+    async def invoke(self, query):
+        await self._call()
+        if type(query).__name__ == 'RequestAppWebView':
+            url = f"https://major.bot/#tgWebAppData={quote(self._init_data())}&tgWebAppVersion=7.10"
+            return SimpleNamespace(url=url)
+        return True
+
+    async def get_me(self):
+        await self._call()
+        return SimpleNamespace(id=self.user_id, username=self.name, first_name=self.name, last_name=None)
+
+    async def get_chat(self, chat_id):
+        await self._call()
+        return SimpleNamespace(id=-100 - abs(hash(chat_id)) % 10 ** 9, username=str(chat_id).split('/')[-1])
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call()
+        return SimpleNamespace(user=SimpleNamespace(id=self.user_id))
+
+    async def join_chat(self, chat_id):
+        return await self.get_chat(chat_id)
+
+
+class FakeSessionDescriptor(SessionDescriptor):
+    """SessionDescriptor whose clients are FakeTelegramClients; counts calls across them."""
+    __slots__ = ('user_id', 'latency', 'calls', 'clients_created')
+
+    def __init__(self, name: str, user_id: int, latency: float = 0.05):
+        super().__init__(name)
+        self.user_id = user_id
+        self.latency = latency
+        self.calls = 0
+        self.clients_created = 0
+
+    def create_client(self) -> FakeTelegramClient:
+        self.clients_created += 1
+        return FakeTelegramClient(name=self.name, user_id=self.user_id, latency=self.latency, session=self)
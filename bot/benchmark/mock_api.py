@@ -0,0 +1,201 @@
+import asyncio
+import base64
+import json
+import random
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs
+
+from aiohttp import web
+
+from bot.utils import clock
+
+
+GAMES = ('bonuses/coins', 'swipe_coin', 'roulette', 'durov')
+
+YOUTUBE_ANSWERS = {
+    "Watch YouTube Video #1": "070624",
+    "Major Games #1": "070624",
+}
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05
+    latency_jitter: float = 0.02
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    game_cooldown: int = 8 * 3600
+    token_ttl: int = 3600
+    squad_id: int = 2237841784
+
+
+@dataclass
+class MockUser:
+    id: int
+    rating: int = 0
+    streak: int = 0
+    squad_id: int | None = None
+    completed_tasks: set = field(default_factory=set)
+    blocked_until: dict = field(default_factory=dict)
+
+
+TASKS = [
+    {"id": 1001, "type": "code", "title": "Watch YouTube Video #1", "award": 1000, "payload": {}},
+    {"id": 1002, "type": "subscribe_channel", "title": "Join Major channel", "award": 1000,
+     "payload": {"url": "https://t.me/major"}},
+    {"id": 1003, "type": "external_api", "title": "Boost Major", "award": 500, "payload": {}},
+    {"id": 1004, "type": "external_api", "title": "Invite a friend", "award": 500, "payload": {}},
+]
+
+DAILY_TASKS = [
+    {"id": 2001, "type": "daily", "title": "Daily check-in", "award": 100, "payload": {}},
+    {"id": 2002, "type": "daily", "title": "Share story", "award": 100, "payload": {}},
+]
+
+
+def make_token(user_id: int, ttl: int) -> str:
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+    payload = {"sub": user_id, "exp": int(clock.time()) + ttl}
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(payload)}.mock"
+
+
+class MockMajorApi:
+    """In-process stand-in for the major.bot endpoints used by Tapper."""
+
+    def __init__(self, config: MockConfig | None = None):
+        self.config = config or MockConfig()
+        self.users = {}
+        self.tokens = {}
+        self.requests = 0
+        self.errors = 0
+
+    def user(self, user_id: int) -> MockUser:
+        if user_id not in self.users:
+            self.users[user_id] = MockUser(id=user_id)
+        return self.users[user_id]
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        self.requests += 1
+        config = self.config
+        await asyncio.sleep(max(0.0, random.gauss(config.latency, config.latency_jitter)))
+
+        if config.throttle_rate and random.random() < config.throttle_rate:
+            self.errors += 1
+            return web.json_response({"detail": "Too many requests"}, status=429, headers={"Retry-After": "1"})
+        if config.error_rate and random.random() < config.error_rate:
+            self.errors += 1
+            return web.json_response({"detail": "Internal error"}, status=500)
+
+        if request.path.startswith('/api/') and request.path not in ('/api/auth/tg/', '/api/answers'):
+            token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if token not in self.tokens:
+                return web.json_response({"detail": "Not authenticated"}, status=401)
+            request['user'] = self.user(self.tokens[token])
+
+        return await handler(request)
+
+    async def auth(self, request: web.Request):
+        body = await request.json()
+        params = parse_qs(body.get('init_data', ''))
+        try:
+            user_id = int(json.loads(params['user'][0])['id'])
+        except (KeyError, IndexError, ValueError):
+            return web.json_response({"detail": "Invalid init data"}, status=400)
+
+        user = self.user(user_id)
+        token = make_token(user_id, self.config.token_ttl)
+        self.tokens[token] = user_id
+        return web.json_response({"access_token": token, "user": {"id": user.id, "squad_id": user.squad_id}})
+
+    async def get_user(self, request: web.Request):
+        user = request['user']
+        return web.json_response({"id": user.id, "rating": user.rating, "squad_id": user.squad_id})
+
+    async def get_squad(self, request: web.Request):
+        squad_id = int(request.match_info['squad_id'])
+        members = sum(1 for user in self.users.values() if user.squad_id == squad_id)
+        return web.json_response({"id": squad_id, "name": "Mock squad", "members_count": members, "rating": 0})
+
+    async def join_squad(self, request: web.Request):
+        request['user'].squad_id = int(request.match_info['squad_id'])
+        return web.json_response({"status": "ok"})
+
+    async def leave_squad(self, request: web.Request):
+        request['user'].squad_id = None
+        return web.json_response({"status": "ok"})
+
+    async def visit(self, request: web.Request):
+        user = request['user']
+        user.streak += 1
+        return web.json_response({"streak": user.streak})
+
+    async def streak(self, request: web.Request):
+        return web.json_response({"streak": request['user'].streak})
+
+    async def get_tasks(self, request: web.Request):
+        tasks = DAILY_TASKS if request.query.get('is_daily') == 'true' else TASKS
+        return web.json_response(tasks)
+
+    async def done_task(self, request: web.Request):
+        user = request['user']
+        body = await request.json()
+        task_id = body.get('task_id')
+        user.completed_tasks.add(task_id)
+        return web.json_response({"task_id": task_id, "is_completed": True})
+
+    def _game_handlers(self, game: str):
+        async def probe(request: web.Request):
+            user = request['user']
+            blocked_until = user.blocked_until.get(game, 0)
+            if blocked_until > clock.time():
+                return web.json_response({"detail": {"blocked_until": blocked_until}}, status=400)
+            return web.json_response({"success": True})
+
+        async def play(request: web.Request):
+            user = request['user']
+            if user.blocked_until.get(game, 0) > clock.time():
+                return web.json_response({"detail": {"blocked_until": user.blocked_until[game]}}, status=400)
+            user.blocked_until[game] = int(clock.time()) + self.config.game_cooldown
+            award = random.randint(100, 1000)
+            user.rating += award
+            return web.json_response({"success": True, "rating_award": award})
+
+        return probe, play
+
+    async def answers(self, request: web.Request):
+        return web.Response(text=json.dumps({"youtube": YOUTUBE_ANSWERS}))
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_post('/api/auth/tg/', self.auth)
+        app.router.add_get('/api/users/{user_id}/', self.get_user)
+        app.router.add_get('/api/squads/{squad_id:\\d+}', self.get_squad)
+        app.router.add_post('/api/squads/{squad_id:\\d+}/join/', self.join_squad)
+        app.router.add_post('/api/squads/leave/', self.leave_squad)
+        app.router.add_post('/api/user-visits/visit/', self.visit)
+        app.router.add_post('/api/user-visits/streak/', self.streak)
+        app.router.add_get('/api/tasks/', self.get_tasks)
+        app.router.add_post('/api/tasks/', self.done_task)
+        app.router.add_get('/api/answers', self.answers)
+
+        for game in GAMES:
+            probe, play = self._game_handlers(game)
+            app.router.add_get(f'/api/{game}/', probe)
+            app.router.add_post(f'/api/{game}/', play)
+
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Starts the server in the running loop and returns its API base URL."""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}/api"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
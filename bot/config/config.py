@@ -7,6 +7,8 @@ class Settings(BaseSettings):
     API_ID: int
     API_HASH: str
    
+    API_BASE_URL: str = 'https://major.bot/api'
+
     REF_ID: str = '339631649'
     TASKS_WITH_JOIN_CHANNEL: bool = False
     HOLD_COIN: list[int] = [585, 600]
@@ -16,6 +18,82 @@ class Settings(BaseSettings):
     RANDOM_DELAY_IN_RUN: list[int] = [0, 15]
     FAKE_USERAGENT: bool = True
     SLEEP_TIME: list[int] = [1800, 3600]
+    CONCURRENT_GAMES: bool = False
+    GAMES_CONCURRENCY: int = 4
+    ADAPTIVE_SCHEDULING: bool = True
+    GAME_COOLDOWN: int = 28800
+    MAX_SLEEP_TIME: int = 28800
+
+    MAX_CONCURRENT_CYCLES: int = 50
+    SCHEDULE_FILE: str = 'sessions/schedule.json'
+    SCHEDULE_SAVE_INTERVAL: int = 30
+    WORKER_RESTART_DELAY: int = 5
+    WORKER_SHUTDOWN_TIMEOUT: int = 30
+
+    HTTP_LIMIT: int = 100
+    HTTP_LIMIT_PER_HOST: int = 20
+    HTTP_HOST_CONCURRENCY: int = 100
+    HTTP_HOST_LIMITS: dict[str, int] = {}
+    HTTP_PROXY_CONCURRENCY: int = 20
+    HTTP_KEEPALIVE_TIMEOUT: int = 60
+    HTTP_DNS_CACHE_TTL: int = 600
+    HTTP_STATS_INTERVAL: int = 600
+
+    STATE_DIR: str = 'sessions/state'
+    ACCESS_TOKEN_TTL: int = 3600
+    INIT_DATA_TTL: int = 86400
+
+    TG_IDLE_TIMEOUT: int = 120
+    TG_MAX_CONNECTED: int = 100
+    LOW_MEMORY: bool = False
+    SESSION_STORAGE: str = 'files'
+    SESSION_DB_PATH: str = 'sessions/sessions.db'
+    SESSION_WATCH_INTERVAL: int = 30
+    PARKED_SESSIONS_FILE: str = 'sessions/parked.json'
+    TG_AUTH_CONCURRENCY: int = 10
+    TG_CALL_RATE: float = 20
+    TG_CALL_BURST: int = 20
+    TG_MIN_CALL_RATE: float = 1
+    TG_RATE_RECOVERY: float = 0.05
+
+    YOUTUBE_ANSWERS_URL: str = 'https://raw.githubusercontent.com/GravelFire/TWFqb3JCb3RQdXp6bGVEdXJvdg/master/answer.py'
+    YOUTUBE_ANSWERS_TTL: int = 1800
+    ANSWERS_POLL_INTERVAL: int = 10
+    PUZZLE_WAKE_SPREAD: int = 300
+
+    TASK_LEDGER_PATH: str = 'sessions/ledger.db'
+
+    METRICS_HOST: str = '127.0.0.1'
+    METRICS_PORT: int = 0
+    METRICS_LOG_INTERVAL: int = 300
+    STATUS_CACHE_TTL: float = 1
+    PROFILE_INTERVAL: float = 0.005
+    PROFILE_TOP: int = 20
+    PROFILE_DIR: str = 'profiles'
+
+    REQUEST_TIMEOUT: float = 20
+    REQUEST_TIMEOUTS: dict[str, float] = {'/auth/tg/': 30}
+    REQUEST_RETRIES: int = 2
+    RETRY_BACKOFF: list[float] = [1, 30]
+    CYCLE_DEADLINE: int = 1800
+    STAGES: list[str] = ['auth', 'login', 'squad_join', 'squad_info', 'visit', 'streak', 'games', 'daily_tasks', 'tasks']
+    STAGE_TIMEOUT: float = 600
+    STAGE_TIMEOUTS: dict[str, float] = {'tasks': 1200}
+    LOGIN_RETRY_DELAY: list[int] = [60, 180]
+    CIRCUIT_FAILURE_THRESHOLD: int = 20
+    CIRCUIT_COOLDOWN: int = 60
+
+    SHARED_CACHE_TTLS: dict[str, int] = {'/squads/{id}': 300}
+
+    LOG_LEVEL: str = 'INFO'
+    LOG_FORMAT: str = 'text'
+    LOG_STAGE_TIMINGS: bool = True
+    LOG_ENQUEUE: bool = False
+    LOG_INFO_RATE: float = 0
+    LOG_INFO_BURST: int = 20
+    LOG_SESSION_DIR: str = ''
+    LOG_SESSION_MAX_BYTES: int = 5 * 1024 * 1024
+    LOG_SESSION_BACKUPS: int = 3
     
     USE_PROXY_FROM_FILE: bool = False
 
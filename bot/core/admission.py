@@ -0,0 +1,88 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from bot.config import settings
+from bot.utils import logger, clock, metrics
+
+
+class TokenBucket:
+    """Lets callers through at ``rate`` per second on average, ``burst`` at once, in arrival order."""
+
+    MIN_WAIT = 1e-3
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = None
+        self._lock = None
+
+    def _refill(self) -> None:
+        now = clock.time()
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                # never a sleep too short to advance the clock, or the refill adds nothing
+                await clock.sleep(max((1 - self._tokens) / self.rate, self.MIN_WAIT))
+                self._refill()
+            self._tokens -= 1
+
+
+class AdmissionController:
+    """Paces Telegram work shared by every session.
+
+    At most TG_AUTH_CONCURRENCY sessions fetch web app data at once, and all
+    MTProto calls share one token bucket of TG_CALL_RATE calls per second.
+    A FloodWait reported by any session halves the shared rate (down to
+    TG_MIN_CALL_RATE); each successful call adds TG_RATE_RECOVERY back.
+    """
+
+    def __init__(self):
+        self._auth = None
+        self._bucket = None
+
+    @property
+    def bucket(self) -> TokenBucket:
+        if self._bucket is None:
+            self._bucket = TokenBucket(settings.TG_CALL_RATE, settings.TG_CALL_BURST)
+            metrics.tg_call_rate.set(value=settings.TG_CALL_RATE)
+        return self._bucket
+
+    @asynccontextmanager
+    async def auth(self):
+        if self._auth is None:
+            self._auth = asyncio.Semaphore(settings.TG_AUTH_CONCURRENCY)
+
+        async with self._auth:
+            yield
+
+    async def throttle(self) -> None:
+        if settings.TG_CALL_RATE:
+            await self.bucket.take()
+
+    def on_success(self) -> None:
+        if settings.TG_CALL_RATE and self.bucket.rate < settings.TG_CALL_RATE:
+            self.bucket.rate = min(settings.TG_CALL_RATE, self.bucket.rate + settings.TG_RATE_RECOVERY)
+            metrics.tg_call_rate.set(value=self.bucket.rate)
+
+    def on_flood_wait(self, seconds: int) -> None:
+        metrics.tg_flood_waits.inc()
+        if not settings.TG_CALL_RATE:
+            return
+
+        rate = max(settings.TG_MIN_CALL_RATE, self.bucket.rate / 2)
+        if rate < self.bucket.rate:
+            logger.warning(f"FloodWait {seconds}s | Telegram call rate lowered to <y>{rate:.2f}/s</y>")
+        self.bucket.rate = rate
+        metrics.tg_call_rate.set(value=rate)
+
+
+admission = AdmissionController()
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+import aiohttp
+
+from bot.utils import logger, clock
+
+
+class YoutubeAnswerProvider:
+    """Codes for YouTube tasks, shared by every session.
+
+    The remote file is downloaded at most once per ``ttl``; callers arriving while a
+    download is running wait for that download instead of starting their own.
+    If the download fails, the previous answers (or ``fallback()``) are used and
+    the next attempt is made after ``retry_interval``.
+    """
+
+    def __init__(self, url: str, ttl: int, fallback: Callable[[], dict], retry_interval: int = 60):
+        self.url = url
+        self.ttl = ttl
+        self.fallback = fallback
+        self.retry_interval = retry_interval
+
+        self._answers = None
+        self._expires_at = 0
+        self._inflight = None
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    async def _download(self) -> dict:
+        timeout = aiohttp.ClientTimeout(total=15)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(self.url) as response:
+                response.raise_for_status()
+                response_data = json.loads(await response.text())
+                return response_data.get('youtube', {})
+
+    async def _refresh(self) -> dict:
+        try:
+            self._answers = await self._download()
+            self._expires_at = clock.time() + self.ttl
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+            self.failures += 1
+            logger.warning(f"Unable to download YouTube answers: {error}")
+            if self._answers is None:
+                self._answers = self.fallback()
+            self._expires_at = clock.time() + self.retry_interval
+        finally:
+            self._inflight = None
+
+        return self._answers
+
+    async def get(self) -> dict:
+        if self._answers is not None and self._expires_at > clock.time():
+            self.hits += 1
+            return self._answers
+
+        if self._inflight is None:
+            self.misses += 1
+            self._inflight = asyncio.ensure_future(self._refresh())
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(self._inflight)
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, coalesced=self.coalesced, failures=self.failures)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _read_json(path: str) -> tuple[float, dict]:
+    mtime = os.stat(path).st_mtime
+    with open(path, 'r') as file:
+        return mtime, json.load(file)
+
+
+class AnswersFile:
+    """answers.json reloaded whenever its mtime changes.
+
+    Parsing happens in a worker thread, and each version is published as a
+    read-only snapshot. Subscribers are called when the puzzle answer changes.
+    """
+
+    def __init__(self, path: str, poll_interval: int):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.snapshot: Mapping = MappingProxyType({})
+
+        self._mtime = None
+        self._listeners = []
+
+    def subscribe(self, callback: Callable[[Mapping], None]) -> None:
+        self._listeners.append(callback)
+
+    def puzzle_active(self) -> bool:
+        return self.snapshot.get('expires', 0) > int(clock.time())
+
+    async def reload(self) -> bool:
+        try:
+            mtime = await asyncio.to_thread(os.path.getmtime, self.path)
+            if mtime == self._mtime:
+                return False
+            mtime, data = await asyncio.to_thread(_read_json, self.path)
+        except (OSError, ValueError) as error:
+            logger.warning(f"Unable to load <y>{self.path}</y>: {error}")
+            return False
+
+        previous = self.snapshot
+        self.snapshot = _freeze(data)
+        self._mtime = mtime
+
+        if (previous.get('answer'), previous.get('expires')) != (self.snapshot.get('answer'), self.snapshot.get('expires')):
+            if previous:
+                logger.info(f"New puzzle answer loaded from <y>{self.path}</y>")
+            for callback in self._listeners:
+                try:
+                    callback(self.snapshot)
+                except Exception as error:
+                    logger.error(f"Answers listener failed: {error}")
+
+        return True
+
+    async def watch(self) -> None:
+        while True:
+            await self.reload()
+            await clock.sleep(self.poll_interval)
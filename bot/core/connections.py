@@ -0,0 +1,123 @@
+import aiohttp
+from aiohttp_proxy import ProxyConnector
+from yarl import URL
+
+from bot.config import settings
+from bot.utils import logger, clock
+
+
+DIRECT = 'direct'
+
+
+def pool_key(proxy: str | None) -> str:
+    """Proxy URL without credentials, used to label per-proxy state in logs and metrics."""
+    if not proxy:
+        return DIRECT
+    return str(URL(proxy).with_user(None))
+
+
+class ConnectorRegistry:
+    """Keep-alive connectors shared by every session that goes through the same proxy.
+
+    Each Tapper still owns its ClientSession (headers, Authorization, cookies),
+    only the connection pool underneath is shared. Pools are keyed by the full
+    proxy URL: sessions on one gateway with different credentials (sticky-session
+    usernames) get their own pools, and only the stats merge them under one label.
+    """
+
+    def __init__(self):
+        self._connectors = {}
+        self._trace_configs = {}
+        self._stats = {}
+        self.extra_trace_configs = []
+
+    def _make_trace_config(self, proxy: str | None) -> aiohttp.TraceConfig:
+        stats = self._stats.setdefault(proxy, {'requests': 0, 'created': 0, 'reused': 0})
+
+        async def on_request_start(session, context, params):
+            stats['requests'] += 1
+
+        async def on_connection_create_end(session, context, params):
+            stats['created'] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            stats['reused'] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def _make_connector(self, proxy: str | None) -> aiohttp.TCPConnector:
+        options = dict(
+            limit=settings.HTTP_LIMIT,
+            limit_per_host=settings.HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+
+        if proxy:
+            return ProxyConnector.from_url(proxy, **options)
+        return aiohttp.TCPConnector(**options)
+
+    def get(self, proxy: str | None) -> aiohttp.TCPConnector:
+        proxy = proxy or None
+        connector = self._connectors.get(proxy)
+
+        if connector is None or connector.closed:
+            connector = self._make_connector(proxy)
+            self._connectors[proxy] = connector
+
+        return connector
+
+    def create_session(self, proxy: str | None, **kwargs) -> aiohttp.ClientSession:
+        proxy = proxy or None
+
+        if proxy not in self._trace_configs:
+            self._trace_configs[proxy] = self._make_trace_config(proxy)
+
+        return aiohttp.ClientSession(
+            connector=self.get(proxy),
+            connector_owner=False,
+            trace_configs=[self._trace_configs[proxy], *self.extra_trace_configs],
+            **kwargs
+        )
+
+    def stats(self) -> dict:
+        """Request and connection counts per proxy, credentials left out of the keys."""
+        merged = {}
+        for proxy, value in self._stats.items():
+            totals = merged.setdefault(pool_key(proxy), dict.fromkeys(value, 0))
+            for name, count in value.items():
+                totals[name] += count
+        return merged
+
+    def open_connections(self) -> dict:
+        """Connections per proxy that are serving a request (active) or kept alive (idle)."""
+        merged = {}
+        for proxy, connector in self._connectors.items():
+            totals = merged.setdefault(pool_key(proxy), dict(active=0, idle=0))
+            totals['active'] += len(connector._acquired)
+            totals['idle'] += sum(len(conns) for conns in connector._conns.values())
+        return merged
+
+    def log_stats(self) -> None:
+        for key, stats in self.stats().items():
+            logger.info(f"HTTP pool <y>{key}</y> | Requests: <y>{stats['requests']}</y> "
+                        f"| New connections: <y>{stats['created']}</y> | Reused: <y>{stats['reused']}</y>")
+
+    async def report_periodically(self) -> None:
+        while True:
+            await clock.sleep(settings.HTTP_STATS_INTERVAL)
+            self.log_stats()
+
+    async def close(self) -> None:
+        for connector in self._connectors.values():
+            if not connector.closed:
+                await connector.close()
+        self._connectors.clear()
+
+
+connectors = ConnectorRegistry()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import zlib
+from typing import Callable
+
+from bot.config import settings
+from bot.utils import logger, clock
+
+
+def in_shard(session_name: str, index: int, workers: int) -> bool:
+    """Stable shard of a session: adding or removing others never moves it to another worker."""
+    return workers <= 1 or zlib.crc32(session_name.encode()) % workers == index
+
+
+def session_mtime(session_name: str) -> float | None:
+    try:
+        return os.path.getmtime(os.path.join('sessions', f"{session_name}.session"))
+    except OSError:
+        return None
+
+
+class ParkedSessions:
+    """Sessions Telegram rejected, kept out of the fleet across restarts.
+
+    A parked session comes back on its own once its ``.session`` file is replaced
+    (its mtime changes) or deleted and added again. Workers share the file, so it
+    is read again before every change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parked = None
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            logger.warning(f"Unable to read parked sessions <y>{self.path}</y>: {error}")
+            return {}
+
+    @property
+    def parked(self) -> dict:
+        if self._parked is None:
+            self._parked = self._load()
+        return self._parked
+
+    def _update(self, change) -> None:
+        self._parked = self._load()
+        change(self._parked)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self._parked, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def park(self, session_name: str, reason: str) -> None:
+        entry = dict(reason=reason, at=int(clock.time()), mtime=session_mtime(session_name))
+        self._update(lambda parked: parked.__setitem__(session_name, entry))
+        logger.warning(f"{session_name} | Parked: {reason}. Replace the session file to bring it back")
+
+    def is_parked(self, session_name: str) -> bool:
+        entry = self.parked.get(session_name)
+        if entry is None:
+            return False
+
+        mtime = session_mtime(session_name)
+        if mtime is not None and mtime != entry.get('mtime'):
+            self._update(lambda parked: parked.pop(session_name, None))
+            logger.info(f"{session_name} | Session file was replaced, unparked")
+            return False
+        return True
+
+    def forget_missing(self, session_names: list[str]) -> None:
+        """Drops sessions that no longer exist, so adding them again starts them."""
+        present = set(session_names)
+
+        def drop_missing(parked: dict) -> None:
+            for name in [name for name in parked if name not in present]:
+                del parked[name]
+
+        if any(name not in present for name in self.parked):
+            self._update(drop_missing)
+
+
+class SessionWatcher:
+    """Adds Tappers for new sessions and removes deleted ones while the fleet runs.
+
+    Every SESSION_WATCH_INTERVAL seconds the session list is read again (only when
+    the directory changed or a parked session may have been replaced) and the proxy
+    file is reloaded if it changed. Running sessions are left alone; new ones get a
+    proxy from the current list.
+    """
+
+    def __init__(self, scheduler, list_sessions: Callable[[], list[str]], create_tapper: Callable,
+                 parked: ParkedSessions, shard: tuple[int, int] = (0, 1),
+                 proxies_path: str | None = None, load_proxies: Callable | None = None):
+        self.scheduler = scheduler
+        self.list_sessions = list_sessions
+        self.create_tapper = create_tapper
+        self.parked = parked
+        self.shard = shard
+        self.proxies_path = proxies_path
+        self.load_proxies = load_proxies
+
+        self._sessions_mtime = self._mtime('sessions')
+        self._proxies_mtime = self._mtime(proxies_path)
+
+    @staticmethod
+    def _mtime(path: str | None) -> float | None:
+        try:
+            return os.path.getmtime(path) if path else None
+        except OSError:
+            return None
+
+    def _check_proxies(self) -> None:
+        mtime = self._mtime(self.proxies_path)
+        if mtime == self._proxies_mtime or not self.load_proxies:
+            return
+
+        self._proxies_mtime = mtime
+        try:
+            self.load_proxies()
+        except (OSError, ValueError) as error:
+            logger.warning(f"Unable to reload proxies: {error}")
+
+    def _sessions_changed(self) -> bool:
+        if settings.SESSION_STORAGE == 'database' or self.parked.parked:
+            return True
+
+        mtime = self._mtime('sessions')
+        changed = mtime != self._sessions_mtime
+        self._sessions_mtime = mtime
+        return changed
+
+    async def check(self) -> None:
+        self._check_proxies()
+        if not self._sessions_changed():
+            return
+
+        all_names = await asyncio.to_thread(self.list_sessions)
+        positions = {name: position for position, name in enumerate(all_names)}
+        names = [name for name in all_names if in_shard(name, *self.shard)]
+        present = set(names)
+        self.parked.forget_missing(all_names)
+        was_parked = set(self.parked.parked)
+
+        for name in [name for name in self.scheduler.tappers
+                     if name not in present and not self.scheduler.is_removing(name)]:
+            await self.scheduler.remove(name)
+            logger.info(f"{name} | Session removed")
+
+        for name in names:
+            if self.parked.is_parked(name):
+                continue
+            if name in self.scheduler.tappers and name not in was_parked:
+                continue
+
+            await self.scheduler.add(self.create_tapper(name, positions[name]), clock.time())
+            logger.info(f"{name} | New session, starting")
+
+    async def watch(self) -> None:
+        while True:
+            await clock.sleep(settings.SESSION_WATCH_INTERVAL)
+            try:
+                await self.check()
+            except Exception as error:
+                logger.error(f"Session discovery failed: {error}")
@@ -0,0 +1,103 @@
+import os
+import re
+import sqlite3
+
+from bot.config import settings
+from bot.utils import clock
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    account TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_attempt REAL,
+    PRIMARY KEY (account, task_id)
+);
+
+CREATE TABLE IF NOT EXISTS task_kinds (
+    task_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL
+);
+"""
+
+CHANNEL_TITLE = re.compile(r'(Join|Subscribe|Follow).*?channel', re.IGNORECASE)
+
+
+class TaskLedger:
+    """One-time task results per account, kept in a SQLite (WAL) database.
+
+    Completed task ids are loaded once per account and kept in memory, so a
+    mature account skips its finished tasks without any API call.
+    """
+
+    def __init__(self, path: str | None = None):
+        self._path = path
+        self._conn = None
+        self._completed = {}
+        self._kinds = None
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.TASK_LEDGER_PATH
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def completed(self, account: str) -> set:
+        if account not in self._completed:
+            rows = self.conn.execute("SELECT task_id FROM tasks WHERE account = ? AND completed = 1", (account,))
+            self._completed[account] = {row[0] for row in rows}
+        return self._completed[account]
+
+    def is_completed(self, account: str, task_id: int) -> bool:
+        return task_id in self.completed(account)
+
+    def record_attempt(self, account: str, task_id: int, completed: bool) -> None:
+        self.conn.execute(
+            "INSERT INTO tasks (account, task_id, completed, attempts, last_attempt) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT (account, task_id) DO UPDATE SET "
+            "completed = MAX(completed, excluded.completed), attempts = attempts + 1, last_attempt = excluded.last_attempt",
+            (account, task_id, int(completed), clock.time())
+        )
+        if completed:
+            self.completed(account).add(task_id)
+
+    def kind(self, task: dict) -> str:
+        """Classifies a task as 'code', 'subscribe' or 'plain', cached by task id."""
+        if self._kinds is None:
+            self._kinds = dict(self.conn.execute("SELECT task_id, kind FROM task_kinds"))
+
+        task_id = task.get('id')
+        if task_id in self._kinds:
+            return self._kinds[task_id]
+
+        if task.get('type') == 'code':
+            kind = 'code'
+        elif task.get('type') == 'subscribe_channel' or CHANNEL_TITLE.search(task.get('title', '')):
+            kind = 'subscribe'
+        else:
+            kind = 'plain'
+
+        if task_id is not None:
+            self._kinds[task_id] = kind
+            self.conn.execute("INSERT OR REPLACE INTO task_kinds (task_id, kind) VALUES (?, ?)", (task_id, kind))
+        return kind
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+task_ledger = TaskLedger()
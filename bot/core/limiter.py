@@ -0,0 +1,116 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from yarl import URL
+
+from bot.config import settings
+from bot.utils import metrics
+
+
+class FairLimiter:
+    """At most ``limit`` holders at once; waiters get free slots round-robin by session.
+
+    A session with ten queued requests gets one slot per turn, the same as a
+    session with one, so a busy session cannot starve the others.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.queued = 0
+        self._queues = OrderedDict()
+
+    async def acquire(self, session_name: str) -> None:
+        if self.active < self.limit and not self._queues:
+            self.active += 1
+            metrics.http_queue_wait.observe((self.name,), 0.0)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_name, deque()).append(waiter)
+        self._set_queued(self.queued + 1)
+        started = time.perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as the caller gave up, pass it on
+                self.release()
+            else:
+                self._discard(session_name, waiter)
+            raise
+        metrics.http_queue_wait.observe((self.name,), time.perf_counter() - started)
+
+    def release(self) -> None:
+        self.active -= 1
+        while self.active < self.limit and self._queues:
+            session_name, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[session_name] = queue
+            self._set_queued(self.queued - 1)
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    def _discard(self, session_name: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(session_name)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[session_name]
+        self._set_queued(self.queued - 1)
+
+    def _set_queued(self, queued: int) -> None:
+        self.queued = queued
+        metrics.http_queue_depth.set((self.name,), queued)
+
+
+class OutboundLimiter:
+    """Caps Major API (and other) requests in flight across every session of the process.
+
+    Each request takes a slot from its proxy (HTTP_PROXY_CONCURRENCY) and then
+    from its host (HTTP_HOST_LIMITS, else HTTP_HOST_CONCURRENCY); 0 means no
+    limit. The proxy slot is taken first so requests waiting on a busy proxy do
+    not hold host slots other proxies could use.
+    """
+
+    def __init__(self):
+        self._limiters = {}
+
+    def _limiter(self, name: str, limit: int) -> FairLimiter | None:
+        if not limit:
+            return None
+
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = FairLimiter(name, limit)
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, session_name: str, url: str, proxy_key: str):
+        host = URL(url).host
+        limiters = [
+            self._limiter(f"proxy:{proxy_key}", settings.HTTP_PROXY_CONCURRENCY),
+            self._limiter(f"host:{host}", settings.HTTP_HOST_LIMITS.get(host, settings.HTTP_HOST_CONCURRENCY)),
+        ]
+        acquired = []
+        try:
+            for limiter in limiters:
+                if limiter is not None:
+                    await limiter.acquire(session_name)
+                    acquired.append(limiter)
+            yield
+        finally:
+            for limiter in reversed(acquired):
+                limiter.release()
+
+    def queued(self) -> int:
+        return sum(limiter.queued for limiter in self._limiters.values())
+
+
+outbound = OutboundLimiter()
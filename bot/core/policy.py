@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import random
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable
+
+import aiohttp
+
+from bot.config import settings
+from bot.utils import logger, clock, metrics
+from bot.exceptions import CircuitOpen, DeadlineExceeded
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+cycle_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar('cycle_deadline', default=None)
+
+
+class CircuitBreaker:
+    """Stops calls to a target after ``threshold`` failures in a row, from any session.
+
+    After ``cooldown`` seconds one probe call is let through; success closes the
+    breaker again, failure keeps it open for another cooldown.
+    """
+
+    def __init__(self, key: str, threshold: int, cooldown: float):
+        self.key = key
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_until = 0.0
+
+    def allow(self) -> bool:
+        if self.failures < self.threshold:
+            return True
+        now = clock.time()
+        if now < self.open_until or now < self.probe_until:
+            return False
+        # Half-open: let a single probe through, another one only if it never reports back
+        self.probe_until = now + self.cooldown
+        return True
+
+    def cancel_probe(self) -> None:
+        self.probe_until = 0.0
+
+    def record_success(self) -> None:
+        if self.failures >= self.threshold:
+            logger.info(f"Circuit <y>{self.key}</y> closed")
+            metrics.circuit_open.set((self.key,), 0)
+        self.failures = 0
+        self.probe_until = 0.0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probe_until = 0.0
+        if self.failures >= self.threshold:
+            if clock.time() >= self.open_until:
+                logger.warning(f"Circuit <y>{self.key}</y> opened for {self.cooldown}s after {self.failures} failures")
+            self.open_until = clock.time() + self.cooldown
+            metrics.circuit_open.set((self.key,), 1)
+
+
+def retry_after(error: Exception) -> float | None:
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - clock.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_failure(error: Exception) -> bool:
+    """Errors that say the target is unhealthy (as opposed to a rejected request)."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def is_unsent(error: Exception) -> bool:
+    """Errors after which the server cannot have acted on the request, so even a POST may be sent again."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+
+class RequestPolicy:
+    """Timeouts, retries with jittered backoff and circuit breakers for API calls."""
+
+    def __init__(self):
+        self._breakers = {}
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(key, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_COOLDOWN)
+        return self._breakers[key]
+
+    @staticmethod
+    def timeout_for(endpoint: str) -> float:
+        return settings.REQUEST_TIMEOUTS.get(endpoint, settings.REQUEST_TIMEOUT)
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        base, cap = settings.RETRY_BACKOFF
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+    async def execute(self, endpoint: str, proxy_key: str, send: Callable[[float], Awaitable], idempotent: bool = True):
+        """Calls ``send(timeout)`` until it succeeds, retries run out or the cycle deadline passes.
+
+        A request that is not ``idempotent`` (claims, completions) is only sent
+        again when it cannot have reached the server: on 429 or a failed
+        connection. After a timeout or 5xx it may have gone through already.
+        """
+        breakers = [self.breaker(f"endpoint:{endpoint}"), self.breaker(f"proxy:{proxy_key}")]
+        deadline = cycle_deadline.get()
+
+        for attempt in range(settings.REQUEST_RETRIES + 1):
+            allowed = [breaker.allow() for breaker in breakers]
+            if not all(allowed):
+                for breaker, probe in zip(breakers, allowed):
+                    if probe:
+                        breaker.cancel_probe()
+                raise CircuitOpen(endpoint)
+
+            timeout = self.timeout_for(endpoint)
+            if deadline is not None:
+                timeout = min(timeout, deadline - clock.time())
+                if timeout <= 0:
+                    raise DeadlineExceeded(endpoint)
+
+            try:
+                result = await send(timeout)
+            except Exception as error:
+                failed = is_failure(error)
+                for breaker in breakers:
+                    if failed:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+
+                retryable = failed if idempotent else is_unsent(error)
+                if not retryable or attempt == settings.REQUEST_RETRIES:
+                    raise
+
+                delay = max(retry_after(error) or 0.0, self.backoff(attempt))
+                if deadline is not None and clock.time() + delay >= deadline:
+                    raise
+
+                metrics.http_retries.inc((endpoint,))
+                await clock.sleep(delay)
+                continue
+
+            for breaker in breakers:
+                breaker.record_success()
+            return result
+
+
+request_policy = RequestPolicy()
@@ -2,6 +2,7 @@ from pyrogram import Client
 
 from bot.config import settings
 from bot.utils import logger
+from bot.core.session_db import session_db
 
 
 async def register_sessions() -> None:
@@ -22,6 +23,8 @@ async def register_sessions() -> None:
         api_hash=API_HASH,
         workdir="sessions/"
     )
+    if settings.SESSION_STORAGE == 'database':
+        session.storage = session_db.storage(session_name)
 
     async with session:
         user_data = await session.get_me()
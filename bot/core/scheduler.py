@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+
+from bot.config import settings
+from bot.utils import logger, clock
+from bot.exceptions import InvalidSession
+
+
+class CycleScheduler:
+    """Runs Tapper cycles from a single queue ordered by the time each session is due.
+
+    At most ``max_concurrent`` cycles run at once, everything else waits in the heap.
+    Due times are saved to ``state_file`` so a restart continues where it stopped.
+    Sessions can be added and removed while it runs; with ``persistent`` set it keeps
+    waiting for new sessions when none are left.
+    """
+
+    def __init__(self, tappers: list, max_concurrent: int, state_file: str):
+        self.tappers = {tapper.session_name: tapper for tapper in tappers}
+        self.max_concurrent = max(1, max_concurrent)
+        self.state_file = state_file
+
+        self._heap = []
+        self._due = {}
+        self._running = set()
+        self._counter = itertools.count()
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._changed = asyncio.Event()
+        self._dirty = False
+        self._removing = set()
+        self.cycles = 0
+        self.persistent = False
+        self.on_invalid_session = None
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_file):
+            return {}
+
+        try:
+            with open(self.state_file, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning(f"Unable to read schedule <y>{self.state_file}</y>: {error}")
+            return {}
+
+    def _save_state(self) -> None:
+        data = dict(self._due)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp_file, self.state_file)
+
+    def schedule(self, session_name: str, due: float) -> None:
+        self._due[session_name] = due
+        heapq.heappush(self._heap, (due, next(self._counter), session_name))
+        self._dirty = True
+        self._changed.set()
+
+    def wake(self, session_name: str, due: float) -> bool:
+        """Moves a waiting session's next cycle forward to ``due``."""
+        if session_name in self._running or session_name not in self._due:
+            return False
+        if self._due[session_name] <= due:
+            return False
+
+        self.schedule(session_name, due)
+        return True
+
+    async def add(self, tapper, due: float) -> None:
+        """Starts running a new session (or a parked one that came back) at ``due``."""
+        previous = self.tappers.get(tapper.session_name)
+        self.tappers[tapper.session_name] = tapper
+        self.schedule(tapper.session_name, due)
+        if previous is not None and previous is not tapper:
+            await previous.close()
+
+    async def remove(self, session_name: str) -> None:
+        """Stops a session; a cycle in progress finishes first."""
+        if session_name in self._running:
+            self._removing.add(session_name)
+            return
+
+        self._due.pop(session_name, None)
+        self._dirty = True
+        self._changed.set()
+        tapper = self.tappers.pop(session_name, None)
+        if tapper is not None:
+            await tapper.close()
+
+    def is_removing(self, session_name: str) -> bool:
+        """True if the session was removed and is only finishing its current cycle."""
+        return session_name in self._removing
+
+    def next_due(self, session_name: str) -> float | None:
+        return self._due.get(session_name)
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._due) - len(self._running)
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def status(self) -> dict:
+        now = clock.time()
+        sessions = {}
+        for session_name, tapper in self.tappers.items():
+            due = self._due.get(session_name)
+            waiting = due is not None and session_name not in self._running
+            sessions[session_name] = dict(
+                phase=tapper.phase if due is not None else 'retired',
+                next_wake_in=max(0, round(due - now)) if waiting else None,
+                last_error=tapper.last_error,
+                last_cycle_duration=tapper.last_cycle_duration,
+            )
+
+        return dict(running=self.running, queued=self.queue_size, cycles=self.cycles, sessions=sessions)
+
+    def _initial_schedule(self) -> None:
+        saved = self._load_state()
+        now = clock.time()
+
+        for session_name in self.tappers:
+            due = saved.get(session_name, 0)
+
+            if due <= now:
+                due = now
+                if settings.USE_RANDOM_DELAY_IN_RUN:
+                    due += random.randint(settings.RANDOM_DELAY_IN_RUN[0], settings.RANDOM_DELAY_IN_RUN[1])
+
+            logger.info(f"{session_name} | Bot will start in <y>{int(due - now)}s</y>")
+            self.schedule(session_name, due)
+
+    async def _wait_changed(self, timeout: float | None) -> None:
+        self._changed.clear()
+        if timeout is None:
+            await self._changed.wait()
+            return
+
+        waiters = {asyncio.ensure_future(self._changed.wait()), asyncio.ensure_future(clock.sleep(timeout))}
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def _run_cycle(self, session_name: str) -> None:
+        tapper = self.tappers[session_name]
+        sleep_time = None
+
+        try:
+            sleep_time = await tapper.run_cycle()
+        except InvalidSession:
+            logger.error(f"{session_name} | Invalid Session")
+            tapper.last_error = 'Invalid session'
+            if self.on_invalid_session:
+                self.on_invalid_session(session_name)
+        except Exception as error:
+            logger.error(f"{session_name} | Unknown error: {error}")
+            tapper.last_error = f"{type(error).__name__}: {error}"
+            sleep_time = random.randint(settings.SLEEP_TIME[0], settings.SLEEP_TIME[1])
+        finally:
+            self._running.discard(session_name)
+            self._slots.release()
+
+        # cancelled cycles (shutdown) never get here and are not counted
+        self.cycles += 1
+
+        if session_name in self._removing:
+            self._removing.discard(session_name)
+            await self.remove(session_name)
+            return
+
+        if sleep_time is None:
+            self._due.pop(session_name, None)
+            self._dirty = True
+            self._changed.set()
+            return
+
+        logger.info(f"{session_name} | Sleep <y>{sleep_time}s</y>")
+        self.schedule(session_name, clock.time() + sleep_time)
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await clock.sleep(settings.SCHEDULE_SAVE_INTERVAL)
+            if self._dirty:
+                self._dirty = False
+                try:
+                    self._save_state()
+                except OSError as error:
+                    logger.warning(f"Unable to save schedule <y>{self.state_file}</y>: {error}")
+
+    async def run(self) -> None:
+        self._initial_schedule()
+        saver = asyncio.create_task(self._save_periodically())
+        cycles = set()
+
+        try:
+            while self._due or self.persistent:
+                if not self._heap:
+                    await self._wait_changed(timeout=None)
+                    continue
+
+                entry = self._heap[0]
+                due, _, session_name = entry
+
+                # Entry was replaced by a newer schedule() call or the session is mid-cycle
+                if self._due.get(session_name) != due or session_name in self._running:
+                    heapq.heappop(self._heap)
+                    continue
+
+                delay = due - clock.time()
+                if delay > 0:
+                    await self._wait_changed(timeout=delay)
+                    continue
+
+                await self._slots.acquire()
+
+                if not self._heap or self._heap[0] is not entry:
+                    self._slots.release()
+                    continue
+
+                heapq.heappop(self._heap)
+                self._running.add(session_name)
+                cycle = asyncio.create_task(self._run_cycle(session_name))
+                cycles.add(cycle)
+                cycle.add_done_callback(cycles.discard)
+        finally:
+            saver.cancel()
+            for cycle in cycles:
+                cycle.cancel()
+            if self._dirty:
+                self._save_state()
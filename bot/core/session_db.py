@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, List, Tuple
+
+from pyrogram.storage import Storage, FileStorage
+from pyrogram.storage.sqlite_storage import get_input_peer
+
+from bot.config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    dc_id INTEGER,
+    api_id INTEGER,
+    test_mode INTEGER,
+    auth_key BLOB,
+    date INTEGER NOT NULL DEFAULT 0,
+    user_id INTEGER,
+    is_bot INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS peers (
+    session TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    access_hash INTEGER,
+    type TEXT NOT NULL,
+    username TEXT,
+    phone_number TEXT,
+    last_update_on INTEGER NOT NULL DEFAULT (CAST(STRFTIME('%s', 'now') AS INTEGER)),
+    PRIMARY KEY (session, id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_peers_username ON peers (session, username);
+CREATE INDEX IF NOT EXISTS idx_peers_phone_number ON peers (session, phone_number);
+"""
+
+SESSION_FIELDS = ('dc_id', 'api_id', 'test_mode', 'auth_key', 'date', 'user_id', 'is_bot')
+
+
+class SharedStorage(Storage):
+    """Pyrogram storage for one account inside the shared SessionDatabase.
+
+    The account's row is read on ``open()`` and kept in memory; changes are
+    written through. Peers are read from and written to the database directly.
+    """
+
+    USERNAME_TTL = 8 * 60 * 60
+
+    def __init__(self, name: str, database: 'SessionDatabase'):
+        super().__init__(name)
+        self.database = database
+        self._session = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.database.conn
+
+    async def open(self):
+        self.conn.execute("INSERT OR IGNORE INTO sessions (name, dc_id) VALUES (?, 2)", (self.name,))
+        row = self.conn.execute(f"SELECT {', '.join(SESSION_FIELDS)} FROM sessions WHERE name = ?",
+                                (self.name,)).fetchone()
+        self._session = dict(zip(SESSION_FIELDS, row))
+
+    async def save(self):
+        await self.date(int(time.time()))
+
+    async def close(self):
+        self._session = None
+
+    async def delete(self):
+        with self.database.transaction():
+            self.conn.execute("DELETE FROM peers WHERE session = ?", (self.name,))
+            self.conn.execute("DELETE FROM sessions WHERE name = ?", (self.name,))
+
+    async def update_peers(self, peers: List[Tuple[int, int, str, str, str]]):
+        with self.database.transaction():
+            self.conn.executemany(
+                "REPLACE INTO peers (session, id, access_hash, type, username, phone_number) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.name, *peer) for peer in peers]
+            )
+
+    async def get_peer_by_id(self, peer_id: int):
+        row = self.conn.execute("SELECT id, access_hash, type FROM peers WHERE session = ? AND id = ?",
+                                (self.name, peer_id)).fetchone()
+        if row is None:
+            raise KeyError(f"ID not found: {peer_id}")
+        return get_input_peer(*row)
+
+    async def get_peer_by_username(self, username: str):
+        row = self.conn.execute(
+            "SELECT id, access_hash, type, last_update_on FROM peers WHERE session = ? AND username = ? "
+            "ORDER BY last_update_on DESC", (self.name, username)).fetchone()
+        if row is None:
+            raise KeyError(f"Username not found: {username}")
+        if abs(time.time() - row[3]) > self.USERNAME_TTL:
+            raise KeyError(f"Username expired: {username}")
+        return get_input_peer(*row[:3])
+
+    async def get_peer_by_phone_number(self, phone_number: str):
+        row = self.conn.execute("SELECT id, access_hash, type FROM peers WHERE session = ? AND phone_number = ?",
+                                (self.name, phone_number)).fetchone()
+        if row is None:
+            raise KeyError(f"Phone number not found: {phone_number}")
+        return get_input_peer(*row)
+
+    def _accessor(self, field: str, value: Any):
+        if value is object:
+            return self._session[field]
+
+        self._session[field] = value
+        self.conn.execute(f"UPDATE sessions SET {field} = ? WHERE name = ?", (value, self.name))
+
+    async def dc_id(self, value: int = object):
+        return self._accessor('dc_id', value)
+
+    async def api_id(self, value: int = object):
+        return self._accessor('api_id', value)
+
+    async def test_mode(self, value: bool = object):
+        return self._accessor('test_mode', value)
+
+    async def auth_key(self, value: bytes = object):
+        return self._accessor('auth_key', value)
+
+    async def date(self, value: int = object):
+        return self._accessor('date', value)
+
+    async def user_id(self, value: int = object):
+        return self._accessor('user_id', value)
+
+    async def is_bot(self, value: bool = object):
+        return self._accessor('is_bot', value)
+
+
+class SessionDatabase:
+    """Auth keys and peer caches of every account in one SQLite (WAL) database.
+
+    Replaces the ``sessions/*.session`` files when SESSION_STORAGE is ``database``:
+    one file descriptor for the whole fleet, and the session list is a single
+    query instead of a directory scan.
+    """
+
+    def __init__(self, path: str | None = None):
+        self._path = path
+        self._conn = None
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.SESSION_DB_PATH
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def names(self) -> list[str]:
+        return [row[0] for row in self.conn.execute("SELECT name FROM sessions ORDER BY name")]
+
+    def storage(self, name: str) -> SharedStorage:
+        return SharedStorage(name, self)
+
+    async def import_file(self, path: str, overwrite: bool = False) -> bool:
+        """Copies a Pyrogram ``.session`` file into the database."""
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not overwrite and self.conn.execute("SELECT 1 FROM sessions WHERE name = ?", (name,)).fetchone():
+            return False
+
+        source = FileStorage(name, Path(os.path.dirname(path) or '.'))
+        await source.open()
+        try:
+            values = [await getattr(source, field)() for field in SESSION_FIELDS]
+            peers = source.conn.execute("SELECT id, access_hash, type, username, phone_number FROM peers").fetchall()
+        finally:
+            await source.close()
+
+        with self.transaction():
+            self.conn.execute("DELETE FROM peers WHERE session = ?", (name,))
+            self.conn.execute(f"REPLACE INTO sessions (name, {', '.join(SESSION_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (name, *values))
+            self.conn.executemany(
+                "INSERT INTO peers (session, id, access_hash, type, username, phone_number) VALUES (?, ?, ?, ?, ?, ?)",
+                [(name, *peer) for peer in peers]
+            )
+        return True
+
+    async def export_file(self, name: str, workdir: str, overwrite: bool = False) -> bool:
+        """Writes one account back out as a Pyrogram ``.session`` file."""
+        target = Path(workdir) / f"{name}{FileStorage.FILE_EXTENSION}"
+        if target.exists():
+            if not overwrite:
+                return False
+            target.unlink()
+
+        source = self.storage(name)
+        await source.open()
+        destination = FileStorage(name, Path(workdir))
+        await destination.open()
+        try:
+            for field in SESSION_FIELDS:
+                await getattr(destination, field)(await getattr(source, field)())
+            peers = self.conn.execute("SELECT id, access_hash, type, username, phone_number FROM peers "
+                                      "WHERE session = ?", (name,)).fetchall()
+            await destination.update_peers(peers)
+            destination.conn.commit()
+        finally:
+            await destination.close()
+            await source.close()
+        return True
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+session_db = SessionDatabase()
@@ -0,0 +1,57 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from bot.config import settings
+from bot.utils import clock, metrics
+
+
+class SharedResponseCache:
+    """Responses that are the same for every account, shared by all sessions.
+
+    Only GETs whose endpoint label is listed in SHARED_CACHE_TTLS are cached, each
+    for its own TTL. Callers arriving while a request for the same URL is running
+    wait for it instead of sending their own. Failed requests are not cached.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._inflight = {}
+
+    @staticmethod
+    def ttl_for(label: str) -> int:
+        return settings.SHARED_CACHE_TTLS.get(label, 0)
+
+    async def _fetch(self, key: str, ttl: int, fetch: Callable[[], Awaitable]):
+        try:
+            value = await fetch()
+            self._entries[key] = (clock.time() + ttl, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def get(self, key: str, label: str, fetch: Callable[[], Awaitable]):
+        entry = self._entries.get(key)
+        if entry and entry[0] > clock.time():
+            metrics.shared_cache_requests.inc((label, 'hit'))
+            return entry[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            metrics.shared_cache_requests.inc((label, 'miss'))
+            inflight = self._inflight[key] = asyncio.ensure_future(self._fetch(key, self.ttl_for(label), fetch))
+        else:
+            metrics.shared_cache_requests.inc((label, 'coalesced'))
+
+        return await asyncio.shield(inflight)
+
+    def stats(self) -> dict:
+        stats = dict(hit=0, miss=0, coalesced=0)
+        for (label, result), value in metrics.shared_cache_requests.values.items():
+            stats[result] += int(value)
+        return stats
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+shared_cache = SharedResponseCache()
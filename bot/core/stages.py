@@ -0,0 +1,153 @@
+"""One Tapper cycle as a list of named stages.
+
+Stages are registered on Tapper methods with ``@stages.register(...)``. STAGES
+in the settings switches them on and sets their order; each stage can also have
+a predicate saying whether it is due this cycle, and a timeout (STAGE_TIMEOUTS,
+else STAGE_TIMEOUT). Every run records how long the stage took and its outcome:
+
+    ok        finished
+    skipped   its predicate said it is not due
+    stopped   finished and ended the cycle early (failed login, no web app data)
+    failed    raised an exception; a required stage also ends the cycle
+    timeout   ran out of time; a required stage also ends the cycle
+"""
+import asyncio
+from typing import Callable
+
+from bot.config import settings
+from bot.utils import logger, clock, metrics
+
+
+class Stage:
+    __slots__ = ('name', 'func', 'phase', 'due', 'required', 'background')
+
+    def __init__(self, name: str, func: Callable, phase: str, due: Callable | None = None,
+                 required: bool = False, background: Callable[[], bool] | None = None):
+        self.name = name
+        self.func = func
+        self.phase = phase
+        self.due = due
+        self.required = required
+        self.background = background
+
+    @property
+    def timeout(self) -> float:
+        return settings.STAGE_TIMEOUTS.get(self.name, settings.STAGE_TIMEOUT)
+
+
+class StageResult:
+    __slots__ = ('name', 'outcome', 'duration')
+
+    def __init__(self, name: str, outcome: str, duration: float = 0.0):
+        self.name = name
+        self.outcome = outcome
+        self.duration = duration
+
+    def __str__(self) -> str:
+        if self.outcome == 'skipped':
+            return f"{self.name} skipped"
+        return f"{self.name} {self.duration:.1f}s" + ('' if self.outcome == 'ok' else f" {self.outcome}")
+
+
+class CycleContext:
+    """What stages of one cycle hand to each other."""
+
+    def __init__(self):
+        self.http_client = None
+        self.user = None
+        self.detail = None
+        self.squad_id = None
+        self.stopped = False
+        self.sleep_time = None
+
+    def stop(self, sleep_time: int | None = None) -> None:
+        """Ends the cycle after this stage; the session sleeps ``sleep_time`` (None - the usual time)."""
+        self.stopped = True
+        self.sleep_time = sleep_time
+
+
+class StageRegistry:
+    def __init__(self):
+        self.stages = {}
+        self._unknown = set()
+
+    def register(self, name: str, phase: str, due: Callable | None = None,
+                 required: bool = False, background: Callable[[], bool] | None = None):
+        """Registers a Tapper method ``(self, ctx)`` as the stage ``name``."""
+        def decorator(func: Callable) -> Callable:
+            self.stages[name] = Stage(name, func, phase, due=due, required=required, background=background)
+            return func
+        return decorator
+
+    def enabled(self) -> list[Stage]:
+        enabled = []
+        for name in settings.STAGES:
+            stage = self.stages.get(name)
+            if stage is not None:
+                enabled.append(stage)
+            elif name not in self._unknown:
+                self._unknown.add(name)
+                logger.warning(f"Unknown stage <y>{name}</y> in STAGES, known: {', '.join(self.stages)}")
+        return enabled
+
+    async def _run_stage(self, tapper, stage: Stage, ctx: CycleContext) -> StageResult:
+        started = clock.time()
+        outcome = 'ok'
+        try:
+            await clock.wait_for(stage.func(tapper, ctx), stage.timeout)
+            if ctx.stopped:
+                outcome = 'stopped'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            tapper.logger.warning(f"{tapper.session_name} | Stage <y>{stage.name}</y> timed out after {stage.timeout}s")
+            tapper.last_error = f"Stage {stage.name} timed out"
+        except Exception as error:
+            outcome = 'failed'
+            tapper.logger.error(f"{tapper.session_name} | Stage <y>{stage.name}</y> failed: {error}")
+            tapper.last_error = f"{type(error).__name__}: {error}"
+
+        if stage.required and outcome in ('failed', 'timeout') and not ctx.stopped:
+            ctx.stop()
+
+        duration = clock.time() - started
+        metrics.stage_duration.observe((stage.name,), duration)
+        metrics.stage_runs.inc((stage.name, outcome))
+        return StageResult(stage.name, outcome, duration)
+
+    async def run(self, tapper, ctx: CycleContext) -> list[StageResult]:
+        """Runs the enabled stages in order until one stops the cycle.
+
+        Background stages start and the next stage runs right away; they are
+        awaited (and their time recorded) once the rest of the cycle is done.
+        """
+        results = []
+        background = []
+        try:
+            for stage in self.enabled():
+                if ctx.stopped:
+                    break
+
+                if stage.due is not None and not stage.due(tapper, ctx):
+                    metrics.stage_runs.inc((stage.name, 'skipped'))
+                    results.append(StageResult(stage.name, 'skipped'))
+                    continue
+
+                tapper.phase = stage.phase
+                if stage.background is not None and stage.background():
+                    background.append((stage, asyncio.create_task(self._run_stage(tapper, stage, ctx))))
+                    continue
+
+                results.append(await self._run_stage(tapper, stage, ctx))
+
+            for stage, task in background:
+                tapper.phase = stage.phase
+                results.append(await task)
+        finally:
+            for _, task in background:
+                if not task.done():
+                    task.cancel()
+
+        return results
+
+
+stages = StageRegistry()
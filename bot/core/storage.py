@@ -0,0 +1,87 @@
+import base64
+import json
+import os
+from urllib.parse import parse_qs
+
+from bot.config import settings
+from bot.utils import logger, clock
+
+
+class SessionStore:
+    """Small JSON file with the state a session keeps between cycles and restarts."""
+
+    def __init__(self, session_name: str, directory: str | None = None):
+        self.session_name = session_name
+        self.directory = directory or settings.STATE_DIR
+        self.path = os.path.join(self.directory, f"{session_name}.json")
+        self._data = None
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning(f"{self.session_name} | Unable to read state <y>{self.path}</y>: {error}")
+            return {}
+
+    def save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.data, file)
+        os.replace(tmp_path, self.path)
+
+    def unload(self) -> None:
+        """Forgets the cached data; the next access reads the file again."""
+        self._data = None
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **values) -> None:
+        self.data.update(values)
+        self.save()
+
+    def discard(self, *keys: str) -> None:
+        if any(key in self.data for key in keys):
+            for key in keys:
+                self.data.pop(key, None)
+            self.save()
+
+    def get_fresh(self, key: str, expires_key: str):
+        """Returns the stored value if it has not expired yet."""
+        value = self.data.get(key)
+        if value and self.data.get(expires_key, 0) > clock.time():
+            return value
+        return None
+
+
+def token_expires_at(access_token: str) -> int:
+    """Reads ``exp`` from a JWT access token, falls back to ACCESS_TOKEN_TTL."""
+    try:
+        payload = access_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        expires = int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        expires = int(clock.time()) + settings.ACCESS_TOKEN_TTL
+
+    return expires - 60
+
+
+def init_data_expires_at(init_data: str) -> int:
+    """Web app data is accepted for INIT_DATA_TTL seconds after its ``auth_date``."""
+    try:
+        auth_date = int(parse_qs(init_data)['auth_date'][0])
+    except (KeyError, IndexError, ValueError):
+        auth_date = int(clock.time())
+
+    return auth_date + settings.INIT_DATA_TTL
@@ -1,37 +1,60 @@
 import asyncio
 import random
+import time
 from urllib.parse import unquote
 
 import aiohttp
-from aiohttp_proxy import ProxyConnector
 from better_proxy import Proxy
 from pyrogram import Client
-from pyrogram.errors import Unauthorized, UserDeactivated, AuthKeyUnregistered, FloodWait
+from pyrogram.errors import Unauthorized, UserDeactivated, AuthKeyUnregistered, FloodWait, BadRequest
 from pyrogram.raw.functions import account, messages
-import time
-import re
-import json
-from pyrogram.raw.types import InputBotAppShortName, InputNotifyPeer, InputPeerNotifySettings
+from pyrogram.raw.types import InputBotAppShortName, InputNotifyPeer, InputPeerNotifySettings, InputPeerUser
 from .agents import generate_random_user_agent
 from bot.config import settings
 from typing import Callable
 import functools
-from bot.utils import logger
+from contextlib import asynccontextmanager
+from bot.utils import logger, clock, metrics
 from bot.exceptions import InvalidSession
 from .headers import headers
+from .connections import connectors, pool_key
+from .limiter import outbound
+from .policy import request_policy, cycle_deadline
+from .telegram import tg_connections, SessionDescriptor
+from .admission import admission
+from .answers import YoutubeAnswerProvider, AnswersFile
+from .ledger import task_ledger
+from .shared_cache import shared_cache
+from .stages import stages, CycleContext
+from .storage import SessionStore, token_expires_at, init_data_expires_at
 
 
-global_answers = {}
+answers_file = AnswersFile(path='answers.json', poll_interval=settings.ANSWERS_POLL_INTERVAL)
 
-async def update_answers_periodically():
-    global global_answers
-    while True:
-        with open('answers.json', 'r') as file:
-            global_answers = json.load(file)
-        await asyncio.sleep(7200)  # Sleep for 2 hours
+youtube_answer_provider = YoutubeAnswerProvider(
+    url=settings.YOUTUBE_ANSWERS_URL,
+    ttl=settings.YOUTUBE_ANSWERS_TTL,
+    fallback=lambda: dict(answers_file.snapshot.get('youtube', {}))
+)
+
+background_tasks = set()
 
 async def initialize_background_tasks():
-    asyncio.create_task(update_answers_periodically())
+    await answers_file.reload()
+    task = asyncio.create_task(answers_file.watch())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+GAME_ENDPOINTS = {
+    '/bonuses/coins/': 'HoldCoins',
+    '/swipe_coin/': 'SwipeCoins',
+    '/roulette/': 'Roulette',
+    '/durov/': 'Puzzle',
+}
+# Login answers that mean the web app data itself is bad; 429 and 5xx keep it for a retry
+LOGIN_REJECTED = (400, 401, 403)
+# Puzzle availability follows answers.json, see Tapper.puzzle_pending
+COOLDOWN_TRACKED = ('HoldCoins', 'SwipeCoins', 'Roulette', 'd_tasks')
 
 def error_handler(func: Callable):
     @functools.wraps(func)
@@ -39,143 +62,319 @@ def error_handler(func: Callable):
         try:
             return await func(*args, **kwargs)
         except Exception as e:
-            await asyncio.sleep(1)
+            metrics.handler_errors.inc((func.__name__, type(e).__name__))
+            args[0].last_error = f"{func.__name__}: {type(e).__name__}: {e}"
+            await clock.sleep(1)
     return wrapper
 
 class Tapper:
-    def __init__(self, tg_client: Client, proxy: str):
-        self.tg_client = tg_client
+    def __init__(self, tg_client: SessionDescriptor | Client, proxy: str):
+        self.tg_session = tg_client
         self.session_name = tg_client.name
+        self.logger = logger.bind(session=self.session_name)
         self.proxy = proxy
         self.tg_web_data = None
-        self.tg_client_id = 0
-        
-    async def get_tg_web_data(self) -> str:
+        self.ref_id = None
+        self.init_data = None
+        # seconds Telegram asked to wait after the last web app data request
+        self.flood_wait = 0
+        self.proxy_checked = False
+        self.http_client = None
+        self.store = SessionStore(self.session_name)
+        self.tg_client_id = self.store.get('tg_client_id', 0)
+        self.user_agent = generate_random_user_agent(device_type='android', browser_type='chrome')
+
+        # shown on the /status page
+        self.phase = 'idle'
+        self.last_error = None
+        self.last_cycle_duration = None
         
-        if self.proxy:
-            proxy = Proxy.from_str(self.proxy)
-            proxy_dict = dict(
-                scheme=proxy.protocol,
-                hostname=proxy.host,
-                port=proxy.port,
-                username=proxy.login,
-                password=proxy.password
-            )
-        else:
-            proxy_dict = None
+    def get_tg_proxy(self) -> dict | None:
+        if not self.proxy:
+            return None
 
-        self.tg_client.proxy = proxy_dict
+        proxy = Proxy.from_str(self.proxy)
+        return dict(
+            scheme=proxy.protocol,
+            hostname=proxy.host,
+            port=proxy.port,
+            username=proxy.login,
+            password=proxy.password
+        )
+
+    @property
+    def tg_client(self) -> Client | None:
+        """The connected client; only set inside ``async with self.telegram()``."""
+        return tg_connections.client(self.session_name)
+
+    @asynccontextmanager
+    async def telegram(self):
+        """Connected client from the shared pool, kept open for a while after the block ends."""
+        if isinstance(self.tg_session, SessionDescriptor) or not self.tg_session.is_connected:
+            self.tg_session.proxy = self.get_tg_proxy()
 
         try:
-            if not self.tg_client.is_connected:
-                try:
-                    await self.tg_client.connect()
+            async with tg_connections.connect(self.tg_session) as tg_client:
+                yield tg_client
+        except (Unauthorized, UserDeactivated, AuthKeyUnregistered):
+            raise InvalidSession(self.session_name)
 
-                except (Unauthorized, UserDeactivated, AuthKeyUnregistered):
-                    raise InvalidSession(self.session_name)
-            
-            while True:
+    async def get_tg_web_data(self) -> str:
+        try:
+            async with admission.auth(), self.telegram():
+                peer = self.get_cached_peer()
+                peer_from_cache = peer is not None
+                if not peer_from_cache:
+                    peer = await self.resolve_bot_peer()
+                
+                ref_id = settings.REF_ID if random.randint(0, 100) <= 85 else "339631649"
+                
                 try:
-                    peer = await self.tg_client.resolve_peer('major')
-                    break
-                except FloodWait as fl:
-                    fls = fl.value
-
-                    logger.warning(f"{self.session_name} | FloodWait {fl}")
-                    logger.info(f"{self.session_name} | Sleep {fls}s")
-                    await asyncio.sleep(fls + 3)
-            
-            ref_id = settings.REF_ID if random.randint(0, 100) <= 85 else "339631649"
-            
-            web_view = await self.tg_client.invoke(messages.RequestAppWebView(
-                peer=peer,
-                app=InputBotAppShortName(bot_id=peer, short_name="start"),
-                platform='android',
-                write_allowed=True,
-                start_param=ref_id
-            ))
-
-            auth_url = web_view.url
-            tg_web_data = unquote(string=auth_url.split('tgWebAppData=')[1].split('&tgWebAppVersion')[0])
-
-            me = await self.tg_client.get_me()
-            self.tg_client_id = me.id
-            
-            if self.tg_client.is_connected:
-                await self.tg_client.disconnect()
+                    web_view = await self.request_app_web_view(peer=peer, ref_id=ref_id)
+                except BadRequest as error:
+                    if not peer_from_cache:
+                        raise
+                    # Cached peer is stale (e.g. access hash changed), resolve it again
+                    self.logger.info(f"{self.session_name} | Cached peer rejected: {error.ID}")
+                    self.store.discard('peer_id', 'peer_access_hash')
+                    peer = await self.resolve_bot_peer()
+                    web_view = await self.request_app_web_view(peer=peer, ref_id=ref_id)
+
+                auth_url = web_view.url
+                tg_web_data = unquote(string=auth_url.split('tgWebAppData=')[1].split('&tgWebAppVersion')[0])
+
+                if not self.tg_client_id:
+                    me = await self.tg_call('get_me', self.tg_client.get_me())
+                    self.tg_client_id = me.id
+                    self.store.update(tg_client_id=me.id)
 
             return ref_id, tg_web_data
 
-        except InvalidSession as error:
-            logger.error(f"{self.session_name} | Invalid session")
-            await asyncio.sleep(delay=3)
+        except FloodWait as error:
+            self.logger.warning(f"{self.session_name} | FloodWait {error}")
+            self.last_error = f"FloodWait: {error.value}s"
+            self.flood_wait = error.value
             return None, None
 
         except Exception as error:
-            logger.error(f"{self.session_name} | Unknown error: {error}")
-            await asyncio.sleep(delay=3)
+            self.logger.error(f"{self.session_name} | Unknown error: {error}")
+            self.last_error = f"{type(error).__name__}: {error}"
+            await clock.sleep(delay=3)
             return None, None
         
+    async def tg_call(self, method: str, coro):
+        try:
+            await admission.throttle()
+        except BaseException:
+            coro.close()
+            raise
+
+        with metrics.track_tg(method):
+            try:
+                result = await coro
+            except FloodWait as error:
+                admission.on_flood_wait(error.value)
+                raise
+
+        admission.on_success()
+        return result
+
+    def get_cached_peer(self) -> InputPeerUser | None:
+        peer_id = self.store.get('peer_id')
+        access_hash = self.store.get('peer_access_hash')
+        if peer_id and access_hash is not None:
+            return InputPeerUser(user_id=peer_id, access_hash=access_hash)
+        return None
+
+    async def resolve_bot_peer(self):
+        while True:
+            try:
+                peer = await self.tg_call('resolve_peer', self.tg_client.resolve_peer('major'))
+                break
+            except FloodWait as fl:
+                fls = fl.value
+
+                self.logger.warning(f"{self.session_name} | FloodWait {fl}")
+                self.logger.info(f"{self.session_name} | Sleep {fls}s")
+                await clock.sleep(fls + 3)
+
+        if isinstance(peer, InputPeerUser):
+            self.store.update(peer_id=peer.user_id, peer_access_hash=peer.access_hash)
+
+        return peer
+
+    async def request_app_web_view(self, peer, ref_id: str):
+        return await self.tg_call('RequestAppWebView', self.tg_client.invoke(messages.RequestAppWebView(
+            peer=peer,
+            app=InputBotAppShortName(bot_id=peer, short_name="start"),
+            platform='android',
+            write_allowed=True,
+            start_param=ref_id
+        )))
+
     @error_handler
     async def join_and_mute_tg_channel(self, link: str):
-        await asyncio.sleep(delay=random.randint(15, 30))
-        
-        if not self.tg_client.is_connected:
-            await self.tg_client.connect()
+        await clock.sleep(delay=random.randint(15, 30))
 
         try:
-            parsed_link = link if 'https://t.me/+' in link else link[13:]
-            
-            chat = await self.tg_client.get_chat(parsed_link)
-            
-            if chat.username:
-                chat_username = chat.username
-            elif chat.id:
-                chat_username = chat.id
-            else:
-                logger.info("Unable to get channel username or id")
-                return
-            
-            logger.info(f"{self.session_name} | Retrieved channel: <y>{chat_username}</y>")
-            try:
-                await self.tg_client.get_chat_member(chat_username, "me")
-            except Exception as error:
-                if error.ID == 'USER_NOT_PARTICIPANT':
-                    await asyncio.sleep(delay=3)
-                    chat = await self.tg_client.join_chat(parsed_link)
-                    chat_id = chat.id
-                    logger.info(f"{self.session_name} | Successfully joined chat <y>{chat_username}</y>")
-                    await asyncio.sleep(random.randint(5, 10))
-                    peer = await self.tg_client.resolve_peer(chat_id)
-                    await self.tg_client.invoke(account.UpdateNotifySettings(
-                        peer=InputNotifyPeer(peer=peer),
-                        settings=InputPeerNotifySettings(mute_until=2147483647)
-                    ))
-                    logger.info(f"{self.session_name} | Successfully muted chat <y>{chat_username}</y>")
+            async with self.telegram():
+                parsed_link = link if 'https://t.me/+' in link else link[13:]
+                
+                chat = await self.tg_call('get_chat', self.tg_client.get_chat(parsed_link))
+                
+                if chat.username:
+                    chat_username = chat.username
+                elif chat.id:
+                    chat_username = chat.id
                 else:
-                    logger.error(f"{self.session_name} | Error while checking channel: <y>{chat_username}</y>: {str(error.ID)}")
+                    self.logger.info("Unable to get channel username or id")
+                    return
+                
+                self.logger.info(f"{self.session_name} | Retrieved channel: <y>{chat_username}</y>")
+                try:
+                    await self.tg_call('get_chat_member', self.tg_client.get_chat_member(chat_username, "me"))
+                except Exception as error:
+                    if error.ID == 'USER_NOT_PARTICIPANT':
+                        await clock.sleep(delay=3)
+                        chat = await self.tg_call('join_chat', self.tg_client.join_chat(parsed_link))
+                        chat_id = chat.id
+                        self.logger.info(f"{self.session_name} | Successfully joined chat <y>{chat_username}</y>")
+                        await clock.sleep(random.randint(5, 10))
+                        peer = await self.tg_call('resolve_peer', self.tg_client.resolve_peer(chat_id))
+                        await self.tg_call('UpdateNotifySettings', self.tg_client.invoke(account.UpdateNotifySettings(
+                            peer=InputNotifyPeer(peer=peer),
+                            settings=InputPeerNotifySettings(mute_until=2147483647)
+                        )))
+                        self.logger.info(f"{self.session_name} | Successfully muted chat <y>{chat_username}</y>")
+                    else:
+                        self.logger.error(f"{self.session_name} | Error while checking channel: <y>{chat_username}</y>: {str(error.ID)}")
         except Exception as e:
-            logger.error(f"{self.session_name} | Error joining/muting channel {link}: {str(e)}")
-            await asyncio.sleep(delay=3)    
+            self.logger.error(f"{self.session_name} | Error joining/muting channel {link}: {str(e)}")
+            await clock.sleep(delay=3)    
         finally:
-            if self.tg_client.is_connected:
-                await self.tg_client.disconnect()
-            await asyncio.sleep(random.randint(10, 20))
+            await clock.sleep(random.randint(10, 20))
     
     @error_handler
     async def make_request(self, http_client, method, endpoint=None, url=None, **kwargs):
-        full_url = url or f"https://major.bot/api{endpoint or ''}"
-        response = await http_client.request(method, full_url, **kwargs)
-        response.raise_for_status()
-        return await response.json()
+        full_url = url or f"{settings.API_BASE_URL}{endpoint or ''}"
+        label = metrics.endpoint_label(endpoint, url)
+
+        async def send(timeout: float):
+            request_kwargs = dict(kwargs)
+            request_kwargs.setdefault('timeout', aiohttp.ClientTimeout(total=timeout))
+            async with outbound.slot(self.session_name, full_url, pool_key(self.proxy)):
+                started = time.perf_counter()
+                with metrics.track(metrics.http_request_duration, metrics.http_errors, metrics.http_in_flight,
+                                   (label, method), (label,)):
+                    async with http_client.request(method, full_url, **request_kwargs) as response:
+                        metrics.http_responses.inc((label, method, str(response.status)))
+                        self.logger.bind(endpoint=label, method=method, status=response.status,
+                                         duration=round(time.perf_counter() - started, 3)).debug(
+                            f"{self.session_name} | {method} {label} -> {response.status}")
+                        if response.status == 401 or (endpoint == "/auth/tg/" and response.status in LOGIN_REJECTED):
+                            self.on_unauthorized(http_client, endpoint)
+                        if response.status == 400 and endpoint in GAME_ENDPOINTS:
+                            await self.on_game_blocked(endpoint, response)
+                        response.raise_for_status()
+                        return await response.json()
+
+        if method == 'GET' and shared_cache.ttl_for(label):
+            return await shared_cache.get(full_url, label, lambda: request_policy.execute(label, pool_key(self.proxy), send))
+        idempotent = method == 'GET' or endpoint == "/auth/tg/"
+        return await request_policy.execute(label, pool_key(self.proxy), send, idempotent=idempotent)
     
+    def on_unauthorized(self, http_client, endpoint):
+        if endpoint == "/auth/tg/":
+            self.logger.info(f"{self.session_name} | Stored web app data was rejected")
+            self.init_data = None
+            self.store.discard('init_data', 'init_data_expires', 'ref_id')
+        else:
+            self.logger.info(f"{self.session_name} | Access token was rejected")
+            self.store.discard('access_token', 'access_token_expires', 'user')
+        http_client.headers.pop('Authorization', None)
+
+    async def on_game_blocked(self, endpoint, response):
+        try:
+            detail = (await response.json()).get('detail')
+            blocked_until = int(detail.get('blocked_until'))
+        except (aiohttp.ContentTypeError, ValueError, TypeError, AttributeError):
+            return
+        self.set_cooldown(GAME_ENDPOINTS[endpoint], blocked_until)
+
+    def set_cooldown(self, name: str, available_at: float) -> None:
+        cooldowns = dict(self.store.get('cooldowns', {}))
+        cooldowns[name] = int(available_at)
+        self.store.update(cooldowns=cooldowns)
+
+    def is_cooling_down(self, name: str) -> bool:
+        if self.store.get('cooldowns', {}).get(name, 0) > clock.time():
+            return True
+        # Puzzle also waits for an answer this session has not used yet
+        return name == 'Puzzle' and not self.puzzle_pending()
+
+    def next_sleep_time(self) -> int:
+        """Random SLEEP_TIME, or the moment the first game/daily set becomes available if all are cooling down."""
+        sleep_time = random.randint(settings.SLEEP_TIME[0], settings.SLEEP_TIME[1])
+        if not settings.ADAPTIVE_SCHEDULING:
+            return sleep_time
+
+        now = clock.time()
+        cooldowns = self.store.get('cooldowns', {})
+        waits = [cooldowns.get(name, 0) - now for name in COOLDOWN_TRACKED]
+        if min(waits) <= 0:
+            return sleep_time
+
+        sleep_time = min(waits) + random.randint(10, 120)
+        return int(min(max(sleep_time, settings.SLEEP_TIME[0]), settings.MAX_SLEEP_TIME))
+
     @error_handler
     async def login(self, http_client, init_data, ref_id):
         response = await self.make_request(http_client, 'POST', endpoint="/auth/tg/", json={"init_data": init_data})
         if response and response.get("access_token", None):
             return response
         return None
+
+    async def authorize(self, http_client):
+        access_token = self.store.get_fresh('access_token', 'access_token_expires')
+        user = self.store.get('user')
+        if access_token and user:
+            http_client.headers['Authorization'] = "Bearer " + access_token
+            return {'access_token': access_token, 'user': user}
+
+        user_data = await self.login(http_client=http_client, init_data=self.init_data, ref_id=self.ref_id)
+        if not user_data:
+            return None
+
+        access_token = user_data.get("access_token")
+        http_client.headers['Authorization'] = "Bearer " + access_token
+        self.logger.info(f"{self.session_name} | <y>⭐ Login successful</y>")
+        self.store.update(
+            access_token=access_token,
+            access_token_expires=token_expires_at(access_token),
+            user=user_data.get('user')
+        )
+        return user_data
+
+    async def load_init_data(self) -> str | None:
+        init_data = self.store.get_fresh('init_data', 'init_data_expires')
+        if init_data:
+            self.ref_id = self.store.get('ref_id')
+            return init_data
+
+        ref_id, init_data = await self.get_tg_web_data()
+        if init_data:
+            self.ref_id = ref_id
+            self.store.update(init_data=init_data, init_data_expires=init_data_expires_at(init_data), ref_id=ref_id)
+        return init_data
     
+    def login_retry_delay(self) -> int:
+        """LOGIN_RETRY_DELAY, or longer if Telegram asked for a longer FloodWait."""
+        delay = random.randint(settings.LOGIN_RETRY_DELAY[0], settings.LOGIN_RETRY_DELAY[1])
+        if self.flood_wait:
+            delay = max(delay, self.flood_wait + 3)
+            self.flood_wait = 0
+        return delay
+
     @error_handler
     async def get_daily(self, http_client):
         return await self.make_request(http_client, 'GET', endpoint="/tasks/?is_daily=true")
@@ -192,12 +391,13 @@ class Tapper:
     async def claim_swipe_coins(self, http_client):
         response = await self.make_request(http_client, 'GET', endpoint="/swipe_coin/")
         if response and response.get('success') is True:
-            logger.info(f"{self.session_name} | Start game <y>SwipeCoins</y>")
+            self.logger.info(f"{self.session_name} | Start game <y>SwipeCoins</y>")
             coins = random.randint(settings.SWIPE_COIN[0], settings.SWIPE_COIN[1])
             payload = {"coins": coins }
-            await asyncio.sleep(55)
+            await clock.sleep(55)
             response = await self.make_request(http_client, 'POST', endpoint="/swipe_coin/", json=payload)
             if response and response.get('success') is True:
+                self.set_cooldown('SwipeCoins', clock.time() + settings.GAME_COOLDOWN)
                 return coins
             return 0
         return 0
@@ -206,12 +406,13 @@ class Tapper:
     async def claim_hold_coins(self, http_client):
         response = await self.make_request(http_client, 'GET', endpoint="/bonuses/coins/")
         if response and response.get('success') is True:
-            logger.info(f"{self.session_name} | Start game <y>HoldCoins</y>")
+            self.logger.info(f"{self.session_name} | Start game <y>HoldCoins</y>")
             coins = random.randint(settings.HOLD_COIN[0], settings.HOLD_COIN[1])
             payload = {"coins": coins }
-            await asyncio.sleep(55)
+            await clock.sleep(55)
             response = await self.make_request(http_client, 'POST', endpoint="/bonuses/coins/", json=payload)
             if response and response.get('success') is True:
+                self.set_cooldown('HoldCoins', clock.time() + settings.GAME_COOLDOWN)
                 return coins
             return 0
         return 0
@@ -220,10 +421,11 @@ class Tapper:
     async def claim_roulette(self, http_client):
         response = await self.make_request(http_client, 'GET', endpoint="/roulette/")
         if response and response.get('success') is True:
-            logger.info(f"{self.session_name} | Start game <y>Roulette</y>")
-            await asyncio.sleep(10)
+            self.logger.info(f"{self.session_name} | Start game <y>Roulette</y>")
+            await clock.sleep(10)
             response = await self.make_request(http_client, 'POST', endpoint="/roulette/")
             if response:
+                self.set_cooldown('Roulette', clock.time() + settings.GAME_COOLDOWN)
                 return response.get('rating_award', 0)
             return 0
         return 0
@@ -238,9 +440,7 @@ class Tapper:
     
     @error_handler
     async def get_detail(self, http_client):
-        detail = await self.make_request(http_client, 'GET', endpoint=f"/users/{self.tg_client_id}/")
-        
-        return detail.get('rating') if detail else 0
+        return await self.make_request(http_client, 'GET', endpoint=f"/users/{self.tg_client_id}/")
     
     @error_handler
     async def leave_squad(self, http_client):
@@ -256,207 +456,267 @@ class Tapper:
     
     @error_handler
     async def youtube_answers(self, http_client, task_id, task_title):
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://raw.githubusercontent.com/GravelFire/TWFqb3JCb3RQdXp6bGVEdXJvdg/master/answer.py") as response:
-                status = response.status
-                if status == 200:
-                    response_data = json.loads(await response.text())
-                    youtube_answers = response_data.get('youtube', {})
-                    if task_title in youtube_answers:
-                        answer = youtube_answers[task_title]
-                        payload = {
-                            "task_id": task_id,
-                            "payload": {
-                                "code": answer
-                            }
-                        }
-                        logger.info(f"{self.session_name} | Attempting YouTube task: <y>{task_title}</y>")
-                        response = await self.make_request(http_client, 'POST', endpoint="/tasks/", json=payload)
-                        if response and response.get('is_completed') is True:
-                            logger.info(f"{self.session_name} | Completed YouTube task: <y>{task_title}</y>")
-                            return True
+        youtube_answers = await youtube_answer_provider.get()
+        if task_title in youtube_answers:
+            answer = youtube_answers[task_title]
+            payload = {
+                "task_id": task_id,
+                "payload": {
+                    "code": answer
+                }
+            }
+            self.logger.info(f"{self.session_name} | Attempting YouTube task: <y>{task_title}</y>")
+            response = await self.make_request(http_client, 'POST', endpoint="/tasks/", json=payload)
+            if response and response.get('is_completed') is True:
+                self.logger.info(f"{self.session_name} | Completed YouTube task: <y>{task_title}</y>")
+                return True
         return False
     
     
     @error_handler
     async def puvel_puzzle(self, http_client):
-        global global_answers
+        answers = answers_file.snapshot
         
-        if global_answers.get('expires', 0) > int(time.time()):
-            answer = global_answers.get('answer')
+        if answers.get('expires', 0) > int(clock.time()):
+            answer = dict(answers.get('answer', {}))
             start = await self.make_request(http_client, 'GET', endpoint="/durov/")
             if start and start.get('success', False):
-                logger.info(f"{self.session_name} | Start game <y>Puzzle</y>")
-                await asyncio.sleep(random.randint(5, 7))
-                return await self.make_request(http_client, 'POST', endpoint="/durov/", json=answer)
+                self.logger.info(f"{self.session_name} | Start game <y>Puzzle</y>")
+                await clock.sleep(random.randint(5, 7))
+                result = await self.make_request(http_client, 'POST', endpoint="/durov/", json=answer)
+                if result:
+                    self.store.update(puzzle_expires=answers.get('expires'))
+                return result
+            if start:
+                # Already played with this answer
+                self.store.update(puzzle_expires=answers.get('expires'))
         return None
 
+    def puzzle_pending(self) -> bool:
+        """True if the current puzzle answer has not been used by this session yet."""
+        return answers_file.puzzle_active() and self.store.get('puzzle_expires') != answers_file.snapshot.get('expires')
+
     @error_handler
     async def check_proxy(self, http_client: aiohttp.ClientSession) -> None:
         response = await self.make_request(http_client, 'GET', url='https://httpbin.org/ip', timeout=aiohttp.ClientTimeout(5))
         ip = response.get('origin')
-        logger.info(f"{self.session_name} | Proxy IP: {ip}")
+        self.logger.info(f"{self.session_name} | Proxy IP: {ip}")
     
-    #@error_handler
-    async def run(self) -> None:
-        if settings.USE_RANDOM_DELAY_IN_RUN:
-                random_delay = random.randint(settings.RANDOM_DELAY_IN_RUN[0], settings.RANDOM_DELAY_IN_RUN[1])
-                logger.info(f"{self.session_name} | Bot will start in <y>{random_delay}s</y>")
-                await asyncio.sleep(random_delay)
-                
-        proxy_conn = ProxyConnector().from_url(self.proxy) if self.proxy else None
-        http_client = aiohttp.ClientSession(headers=headers, connector=proxy_conn)
-        ref_id, init_data = await self.get_tg_web_data()
-        
-        if not init_data:
-            if not http_client.closed:
-                await http_client.close()
-            if proxy_conn:
-                if not proxy_conn.closed:
-                    proxy_conn.close()
-            return
-                    
-        if self.proxy:
+    async def play_game(self, task_name, task_func, http_client):
+        result = await task_func(http_client=http_client)
+        if result:
+            await clock.sleep(random.randint(1, 3))
+            reward = "+5000⭐" if task_name == 'Puzzle' else f"+{result}⭐"
+            self.logger.info(f"{self.session_name} | Reward {task_name}: <y>{reward}</y>")
+        return result
+
+    async def play_games_concurrently(self, games, http_client):
+        """Runs the games side by side, at most GAMES_CONCURRENCY at a time."""
+        semaphore = asyncio.Semaphore(max(1, settings.GAMES_CONCURRENCY))
+
+        async def play(task_name, task_func):
+            async with semaphore:
+                await clock.sleep(random.randint(5, 10))
+                return await self.play_game(task_name, task_func, http_client=http_client)
+
+        return await asyncio.gather(*(play(task_name, task_func) for task_name, task_func in games))
+
+    def get_http_client(self) -> aiohttp.ClientSession:
+        if self.http_client is None or self.http_client.closed:
+            self.http_client = connectors.create_session(proxy=self.proxy, headers=headers)
+
+            if settings.FAKE_USERAGENT:
+                self.http_client.headers['User-Agent'] = self.user_agent
+
+        return self.http_client
+
+    async def close(self) -> None:
+        if self.http_client and not self.http_client.closed:
+            await self.http_client.close()
+        self.http_client = None
+
+    async def run_cycle(self) -> int:
+        """Runs one lap for the session and returns seconds until the next one.
+
+        Only InvalidSession takes the session out of the fleet; any other failure reschedules it.
+        """
+        token = cycle_deadline.set(clock.time() + settings.CYCLE_DEADLINE)
+        started = clock.time()
+        try:
+            return await self._run_cycle()
+        finally:
+            cycle_deadline.reset(token)
+            self.phase = 'sleeping'
+            self.last_cycle_duration = round(clock.time() - started, 1)
+            if settings.LOW_MEMORY:
+                # nothing but the descriptor stays in memory between cycles
+                await self.close()
+                self.store.unload()
+
+    async def _run_cycle(self) -> int:
+        ctx = CycleContext()
+        ctx.http_client = self.get_http_client()
+        started = clock.time()
+
+        results = await stages.run(self, ctx)
+
+        if settings.LOG_STAGE_TIMINGS and results:
+            breakdown = ' | '.join(str(result) for result in results)
+            self.logger.info(f"{self.session_name} | Cycle <y>{clock.time() - started:.1f}s</y> | {breakdown}")
+
+        return ctx.sleep_time if ctx.sleep_time is not None else self.next_sleep_time()
+
+    def due_games(self) -> list[tuple[str, Callable]]:
+        games = [
+            ('HoldCoins', self.claim_hold_coins),
+            ('SwipeCoins', self.claim_swipe_coins),
+            ('Roulette', self.claim_roulette),
+            ('Puzzle', self.puvel_puzzle),
+        ]
+        if settings.ADAPTIVE_SCHEDULING:
+            games = [(task_name, task_func) for task_name, task_func in games if not self.is_cooling_down(task_name)]
+        return games
+
+    @stages.register('auth', phase='auth', required=True)
+    async def stage_auth(self, ctx: CycleContext) -> None:
+        if not self.init_data:
+            self.init_data = await self.load_init_data()
+
+            # temporary failure (timeout, network, FloodWait); an invalid session raises instead
+            if not self.init_data:
+                ctx.stop(self.login_retry_delay())
+
+    @stages.register('login', phase='login', required=True)
+    async def stage_login(self, ctx: CycleContext) -> None:
+        http_client = ctx.http_client
+        if self.proxy and not self.proxy_checked:
             await self.check_proxy(http_client=http_client)
-        
-        fake_user_agent = generate_random_user_agent(device_type='android', browser_type='chrome')
-        
-        
-        if settings.FAKE_USERAGENT:            
-            http_client.headers['User-Agent'] = fake_user_agent
-        
-        while True:
-            try:
-                if http_client.closed:
-                    if proxy_conn:
-                        if not proxy_conn.closed:
-                            proxy_conn.close()
-
-                    proxy_conn = ProxyConnector().from_url(self.proxy) if self.proxy else None
-                    http_client = aiohttp.ClientSession(headers=headers, connector=proxy_conn)
-                    if settings.FAKE_USERAGENT:            
-                        http_client.headers['User-Agent'] = fake_user_agent
-                
-                user_data = await self.login(http_client=http_client, init_data=init_data, ref_id=ref_id)
-                if not user_data:
-                    logger.info(f"{self.session_name} | <r>Failed login</r>")
-                    sleep_time = random.randint(settings.SLEEP_TIME[0], settings.SLEEP_TIME[1])
-                    logger.info(f"{self.session_name} | Sleep <y>{sleep_time}s</y>")
-                    await asyncio.sleep(delay=sleep_time)
-                    continue
-                http_client.headers['Authorization'] = "Bearer " + user_data.get("access_token")
-                logger.info(f"{self.session_name} | <y>⭐ Login successful</y>")
-                user = user_data.get('user')
-                squad_id = user.get('squad_id')
-                rating = await self.get_detail(http_client=http_client)
-                logger.info(f"{self.session_name} | ID: <y>{user.get('id')}</y> | Points : <y>{rating}</y>")
-                
-                
-                if settings.SQUAD_ID and squad_id is None:
-                    await self.join_squad(http_client=http_client, squad_id=settings.SQUAD_ID)
-                    squad_id = settings.SQUAD_ID
-                    await asyncio.sleep(random.randint(1, 3))
-                
-                if settings.SQUAD_ID and squad_id != settings.SQUAD_ID:
-                    await self.leave_squad(http_client=http_client)
-                    await asyncio.sleep(random.randint(5, 7))
-                    await self.join_squad(http_client=http_client, squad_id=settings.SQUAD_ID)
-                    squad_id = settings.SQUAD_ID
-                    await asyncio.sleep(random.randint(1, 3))
-                    
-                    
-                logger.info(f"{self.session_name} | Squad ID: <y>{squad_id}</y>")
-                data_squad = await self.get_squad(http_client=http_client, squad_id=squad_id)
-                if data_squad:
-                    logger.info(f"{self.session_name} | Squad : <y>{data_squad.get('name')}</y> | Member : <y>{data_squad.get('members_count')}</y> | Ratings : <y>{data_squad.get('rating')}</y>")    
-                
-                data_visit = await self.visit(http_client=http_client)
-                if data_visit:
-                    await asyncio.sleep(1)
-                    logger.info(f"{self.session_name} | Daily Streak : <y>{data_visit.get('streak')}</y>")
-                
-                await asyncio.sleep(random.randint(1, 3))
-                await self.streak(http_client=http_client)
-                
-                
-                tasks = [
-                    ('HoldCoins', self.claim_hold_coins),
-                    ('SwipeCoins', self.claim_swipe_coins),
-                    ('Roulette', self.claim_roulette),
-                    ('Puzzle', self.puvel_puzzle),
-                    ('d_tasks', self.get_daily),
-                    ('m_tasks', self.get_tasks)
-                ]
-                
-                random.shuffle(tasks)
-                
-                for task_name, task_func in tasks:
-                    await asyncio.sleep(random.randint(5, 10))
-                    #logger.info(f"{self.session_name} | Task <y>{task_name}</y>")
-                    
-                    # Игрушки в Major, выполняются раз в 8 часов или если перейдут по рефералке 10 пользователей
-                    if task_name in ['HoldCoins', 'SwipeCoins', 'Roulette', 'Puzzle']:
-                        result = await task_func(http_client=http_client)
-                        if result:
-                            await asyncio.sleep(random.randint(1, 3))
-                            reward = "+5000⭐" if task_name == 'Puzzle' else f"+{result}⭐"
-                            logger.info(f"{self.session_name} | Reward {task_name}: <y>{reward}</y>")
-                    
-                    # Ежедневные задания, которые можно выполнять каждый день
-                    elif task_name == 'd_tasks':
-                        data_daily = await task_func(http_client=http_client)
-                        if data_daily:
-                            random.shuffle(data_daily)
-                            for daily in data_daily:
-                                await asyncio.sleep(random.randint(5, 10))
-                                id = daily.get('id')
-                                title = daily.get('title')
-                                data_done = await self.done_tasks(http_client=http_client, task_id=id)
-                                if data_done and data_done.get('is_completed') is True:
-                                    logger.info(f"{self.session_name} | Daily Task : <y>{daily.get('title')}</y> | Reward : <y>{daily.get('award')}</y>")
-                    
-                    # Основные задания, которые одноразово выполняются
-                    elif task_name == 'm_tasks':
-                        data_task = await task_func(http_client=http_client)
-                        if data_task:
-                            random.shuffle(data_task)
-                            for task in data_task:
-                                await asyncio.sleep(random.randint(5, 10))
-                                id = task.get('id')
-                                title = task.get("title", "")
-                                if task.get("type") == "code":
-                                    await self.youtube_answers(http_client=http_client, task_id=id, task_title=title)
-                                    continue
-                                
-                                if task.get('type') == 'subscribe_channel' or re.findall(r'(Join|Subscribe|Follow).*?channel', title, re.IGNORECASE):
-                                    if not settings.TASKS_WITH_JOIN_CHANNEL:
-                                        continue
-                                    await self.join_and_mute_tg_channel(link=task.get('payload').get('url'))
-                                    await asyncio.sleep(random.randint(5, 10))
-                                
-                                data_done = await self.done_tasks(http_client=http_client, task_id=id)
-                                if data_done and data_done.get('is_completed') is True:
-                                    logger.info(f"{self.session_name} | Task : <y>{title}</y> | Reward : <y>{task.get('award')}</y>")
-                    
-                await http_client.close()
-                if proxy_conn:
-                    if not proxy_conn.closed:
-                        proxy_conn.close()
-
-            except Exception as error:
-                logger.error(f"{self.session_name} | Unknown error: {error}")
-                await asyncio.sleep(delay=3)
-                
-                   
-            sleep_time = random.randint(settings.SLEEP_TIME[0], settings.SLEEP_TIME[1])
-            logger.info(f"{self.session_name} | Sleep <y>{sleep_time}s</y>")
-            await asyncio.sleep(delay=sleep_time)    
-            
-        
-            
+            self.proxy_checked = True
+
+        user_data = await self.authorize(http_client=http_client)
+        if not user_data:
+            self.logger.info(f"{self.session_name} | <r>Failed login</r>")
+            ctx.stop(self.login_retry_delay())
+            return
+        user = user_data.get('user')
+        self.tg_client_id = self.tg_client_id or user.get('id')
+        detail = await self.get_detail(http_client=http_client)
+
+        # Stored token was rejected, log in again with the stored web app data
+        if not detail and 'Authorization' not in http_client.headers:
+            if not self.init_data:
+                self.init_data = await self.load_init_data()
+            user_data = await self.authorize(http_client=http_client) if self.init_data else None
+            if not user_data:
+                self.logger.info(f"{self.session_name} | <r>Failed login</r>")
+                ctx.stop(self.login_retry_delay())
+                return
+            user = user_data.get('user')
+            detail = await self.get_detail(http_client=http_client)
+
+        ctx.user = user
+        ctx.detail = detail
+        ctx.squad_id = detail.get('squad_id', user.get('squad_id')) if detail else user.get('squad_id')
+        rating = detail.get('rating') if detail else 0
+        self.logger.info(f"{self.session_name} | ID: <y>{user.get('id')}</y> | Points : <y>{rating}</y>")
+
+    @stages.register('squad_join', phase='squad',
+                     due=lambda self, ctx: bool(settings.SQUAD_ID) and ctx.squad_id != settings.SQUAD_ID)
+    async def stage_squad_join(self, ctx: CycleContext) -> None:
+        if ctx.squad_id is not None:
+            await self.leave_squad(http_client=ctx.http_client)
+            await clock.sleep(random.randint(5, 7))
+
+        await self.join_squad(http_client=ctx.http_client, squad_id=settings.SQUAD_ID)
+        ctx.squad_id = settings.SQUAD_ID
+        await clock.sleep(random.randint(1, 3))
+
+        if self.store.get('user') and ctx.user.get('squad_id') != ctx.squad_id:
+            self.store.update(user={**ctx.user, 'squad_id': ctx.squad_id})
+
+    @stages.register('squad_info', phase='squad', due=lambda self, ctx: ctx.squad_id is not None)
+    async def stage_squad_info(self, ctx: CycleContext) -> None:
+        self.logger.info(f"{self.session_name} | Squad ID: <y>{ctx.squad_id}</y>")
+        data_squad = await self.get_squad(http_client=ctx.http_client, squad_id=ctx.squad_id)
+        if data_squad:
+            self.logger.info(f"{self.session_name} | Squad : <y>{data_squad.get('name')}</y> | Member : <y>{data_squad.get('members_count')}</y> | Ratings : <y>{data_squad.get('rating')}</y>")
+
+    @stages.register('visit', phase='squad')
+    async def stage_visit(self, ctx: CycleContext) -> None:
+        data_visit = await self.visit(http_client=ctx.http_client)
+        if data_visit:
+            await clock.sleep(1)
+            self.logger.info(f"{self.session_name} | Daily Streak : <y>{data_visit.get('streak')}</y>")
+
+    @stages.register('streak', phase='squad')
+    async def stage_streak(self, ctx: CycleContext) -> None:
+        await clock.sleep(random.randint(1, 3))
+        await self.streak(http_client=ctx.http_client)
+
+    # Игрушки в Major, выполняются раз в 8 часов или если перейдут по рефералке 10 пользователей
+    @stages.register('games', phase='games', due=lambda self, ctx: bool(self.due_games()),
+                     background=lambda: settings.CONCURRENT_GAMES)
+    async def stage_games(self, ctx: CycleContext) -> None:
+        games = self.due_games()
+        random.shuffle(games)
+
+        if settings.CONCURRENT_GAMES:
+            await self.play_games_concurrently(games, http_client=ctx.http_client)
+            return
+
+        for task_name, task_func in games:
+            await clock.sleep(random.randint(5, 10))
+            await self.play_game(task_name, task_func, http_client=ctx.http_client)
+
+    # Ежедневные задания, которые можно выполнять каждый день
+    @stages.register('daily_tasks', phase='tasks',
+                     due=lambda self, ctx: not (settings.ADAPTIVE_SCHEDULING and self.is_cooling_down('d_tasks')))
+    async def stage_daily_tasks(self, ctx: CycleContext) -> None:
+        await clock.sleep(random.randint(5, 10))
+        data_daily = await self.get_daily(http_client=ctx.http_client)
+        all_completed = data_daily is not None
+        if data_daily:
+            random.shuffle(data_daily)
+            for daily in data_daily:
+                await clock.sleep(random.randint(5, 10))
+                data_done = await self.done_tasks(http_client=ctx.http_client, task_id=daily.get('id'))
+                if data_done and data_done.get('is_completed') is True:
+                    self.logger.info(f"{self.session_name} | Daily Task : <y>{daily.get('title')}</y> | Reward : <y>{daily.get('award')}</y>")
+                else:
+                    all_completed = False
+        if all_completed:
+            # Daily tasks reset at midnight UTC; any that failed are retried next cycle
+            self.set_cooldown('d_tasks', (clock.time() // 86400 + 1) * 86400)
+
+    # Основные задания, которые одноразово выполняются
+    @stages.register('tasks', phase='tasks')
+    async def stage_tasks(self, ctx: CycleContext) -> None:
+        http_client = ctx.http_client
+        await clock.sleep(random.randint(5, 10))
+        data_task = await self.get_tasks(http_client=http_client)
+        if not data_task:
+            return
+
+        data_task = [task for task in data_task if not task_ledger.is_completed(self.session_name, task.get('id'))]
+        if not settings.TASKS_WITH_JOIN_CHANNEL:
+            data_task = [task for task in data_task if task_ledger.kind(task) != 'subscribe']
+        random.shuffle(data_task)
+        for task in data_task:
+            await clock.sleep(random.randint(5, 10))
+            id = task.get('id')
+            title = task.get("title", "")
+            kind = task_ledger.kind(task)
+            if kind == 'code':
+                completed = await self.youtube_answers(http_client=http_client, task_id=id, task_title=title)
+                task_ledger.record_attempt(self.session_name, id, completed=bool(completed))
+                continue
+
+            if kind == 'subscribe':
+                await self.join_and_mute_tg_channel(link=task.get('payload').get('url'))
+                await clock.sleep(random.randint(5, 10))
 
-async def run_tapper(tg_client: Client, proxy: str | None):
-    try:
-        await Tapper(tg_client=tg_client, proxy=proxy).run()
-    except InvalidSession:
-        logger.error(f"{tg_client.name} | Invalid Session")
+            data_done = await self.done_tasks(http_client=http_client, task_id=id)
+            completed = bool(data_done and data_done.get('is_completed') is True)
+            task_ledger.record_attempt(self.session_name, id, completed=completed)
+            if completed:
+                self.logger.info(f"{self.session_name} | Task : <y>{title}</y> | Reward : <y>{task.get('award')}</y>")
@@ -0,0 +1,188 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from pyrogram import Client
+
+from bot.config import settings
+from bot.utils import logger, clock, metrics
+from .admission import admission
+from .session_db import session_db
+
+
+class SessionDescriptor:
+    """What it takes to build a session's Pyrogram Client, without building it.
+
+    Tappers hold one of these; TelegramConnections creates the Client when the
+    session needs Telegram and drops it again once it is disconnected.
+    """
+    __slots__ = ('name', 'workdir', 'proxy')
+
+    def __init__(self, name: str, workdir: str = 'sessions/', proxy: dict | None = None):
+        self.name = name
+        self.workdir = workdir
+        self.proxy = proxy
+
+    def create_client(self) -> Client:
+        if settings.SESSION_STORAGE == 'database':
+            client = Client(name=self.name, api_id=settings.API_ID, api_hash=settings.API_HASH,
+                            in_memory=True, proxy=self.proxy)
+            client.storage = session_db.storage(self.name)
+            return client
+
+        return Client(
+            name=self.name,
+            api_id=settings.API_ID,
+            api_hash=settings.API_HASH,
+            workdir=self.workdir,
+            proxy=self.proxy,
+        )
+
+
+class _Connection:
+    def __init__(self, session):
+        self.session = session
+        # clients built from a descriptor exist only while connected
+        self.client = None if isinstance(session, SessionDescriptor) else session
+        self.users = 0
+        self.holds_slot = False
+        self.lock = asyncio.Lock()
+        self.closer = None
+        self.closing = False
+
+
+class TelegramConnections:
+    """Keeps Pyrogram clients connected across back-to-back operations.
+
+    A client is disconnected after TG_IDLE_TIMEOUT seconds without users (at once
+    in LOW_MEMORY mode), and no more than TG_MAX_CONNECTED clients are connected
+    at the same time (idle ones are disconnected first to make room). Accepts a
+    Client or a SessionDescriptor; for the latter the Client is created on connect
+    and dropped on disconnect.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._connected = 0
+        self._condition = None
+
+    @property
+    def connected(self) -> int:
+        return self._connected
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _take_slot(self) -> None:
+        async with self.condition:
+            while self._connected >= settings.TG_MAX_CONNECTED:
+                if not await self._evict_idle():
+                    await self.condition.wait()
+            self._connected += 1
+
+    async def _free_slot(self) -> None:
+        async with self.condition:
+            self._connected -= 1
+            self.condition.notify()
+
+    async def _evict_idle(self) -> bool:
+        for connection in self._connections.values():
+            if connection.users == 0 and connection.holds_slot and not connection.closing:
+                if connection.closer:
+                    connection.closer.cancel()
+                    connection.closer = None
+                await self._disconnect(connection, free_slot=False)
+                self._connected -= 1
+                return True
+        return False
+
+    async def _disconnect(self, connection: _Connection, free_slot: bool = True) -> None:
+        connection.holds_slot = False
+        try:
+            if connection.client and connection.client.is_connected:
+                await connection.client.disconnect()
+        except Exception as error:
+            logger.warning(f"{connection.session.name} | Error while disconnecting: {error}")
+        finally:
+            if connection.client is not connection.session:
+                connection.client = None
+                if connection.users == 0 and self._connections.get(connection.session.name) is connection:
+                    del self._connections[connection.session.name]
+            if free_slot:
+                await self._free_slot()
+
+    async def _close_later(self, connection: _Connection) -> None:
+        await clock.sleep(0 if settings.LOW_MEMORY else settings.TG_IDLE_TIMEOUT)
+        connection.closing = True
+        try:
+            async with connection.lock:
+                if connection.users == 0 and connection.holds_slot:
+                    await self._disconnect(connection)
+        finally:
+            connection.closing = False
+            connection.closer = None
+
+    def client(self, session_name: str) -> Client | None:
+        connection = self._connections.get(session_name)
+        return connection.client if connection else None
+
+    async def acquire(self, session) -> Client:
+        connection = self._connections.get(session.name)
+        if connection is None or connection.session is not session:
+            connection = self._connections[session.name] = _Connection(session)
+
+        connection.users += 1
+        if connection.closer and not connection.closing:
+            connection.closer.cancel()
+            connection.closer = None
+
+        try:
+            async with connection.lock:
+                if not connection.holds_slot:
+                    await self._take_slot()
+                    connection.holds_slot = True
+                    try:
+                        if connection.client is None:
+                            connection.client = session.create_client()
+                        if not connection.client.is_connected:
+                            await admission.throttle()
+                            with metrics.track_tg('connect'):
+                                await connection.client.connect()
+                    except BaseException:
+                        await self._disconnect(connection)
+                        raise
+        except BaseException:
+            connection.users -= 1
+            raise
+
+        return connection.client
+
+    def release(self, session) -> None:
+        connection = self._connections.get(session.name)
+        if connection is None:
+            return
+
+        connection.users -= 1
+        if connection.users == 0 and connection.holds_slot and connection.closer is None:
+            connection.closer = asyncio.create_task(self._close_later(connection))
+
+    @asynccontextmanager
+    async def connect(self, session):
+        client = await self.acquire(session)
+        try:
+            yield client
+        finally:
+            self.release(session)
+
+    async def close(self) -> None:
+        for connection in list(self._connections.values()):
+            if connection.closer:
+                connection.closer.cancel()
+            if connection.holds_slot:
+                await self._disconnect(connection)
+        self._connections.clear()
+
+
+tg_connections = TelegramConnections()
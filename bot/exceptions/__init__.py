@@ -1,2 +1,10 @@
 class InvalidSession(BaseException):
     ...
+
+
+class CircuitOpen(Exception):
+    ...
+
+
+class DeadlineExceeded(Exception):
+    ...
@@ -0,0 +1,99 @@
+"""Moves sessions between ``sessions/*.session`` files and the shared session database.
+
+    python -m bot.sessions import      # every sessions/*.session into SESSION_DB_PATH
+    python -m bot.sessions export      # every database session back into sessions/
+    python -m bot.sessions compare     # startup time and open files, files vs database
+"""
+import argparse
+import asyncio
+import glob
+import os
+import time
+from pathlib import Path
+
+from pyrogram.storage import FileStorage
+
+from bot.utils import logger
+from bot.core.session_db import session_db
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bot.sessions')
+    parser.add_argument('command', choices=('import', 'export', 'compare'))
+    parser.add_argument('--workdir', default='sessions/', help='Directory with .session files')
+    parser.add_argument('--overwrite', action='store_true', help='Replace sessions that already exist')
+    return parser.parse_args()
+
+
+def session_files(workdir: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(workdir, f"*{FileStorage.FILE_EXTENSION}")))
+
+
+async def import_sessions(args: argparse.Namespace) -> None:
+    imported = skipped = 0
+    for path in session_files(args.workdir):
+        if await session_db.import_file(path, overwrite=args.overwrite):
+            imported += 1
+        else:
+            skipped += 1
+    logger.info(f"Imported <y>{imported}</y> sessions into <y>{session_db.path}</y> | Already there: <y>{skipped}</y>")
+
+
+async def export_sessions(args: argparse.Namespace) -> None:
+    exported = skipped = 0
+    for name in session_db.names():
+        if await session_db.export_file(name, args.workdir, overwrite=args.overwrite):
+            exported += 1
+        else:
+            skipped += 1
+    logger.info(f"Exported <y>{exported}</y> sessions to <y>{args.workdir}</y> | Files already there: <y>{skipped}</y>")
+
+
+def open_files() -> int:
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return -1
+
+
+async def measure(open_storage, names) -> dict:
+    """Time to list the sessions and open each one as a connected client would, and the fds it holds."""
+    fds_before = open_files()
+    started = time.perf_counter()
+    storages = []
+    for name in names():
+        storage = open_storage(name)
+        await storage.open()
+        await storage.auth_key()
+        storages.append(storage)
+    elapsed = time.perf_counter() - started
+    fds = open_files() - fds_before
+
+    for storage in storages:
+        await storage.close()
+    return dict(sessions=len(storages), seconds=elapsed, fds=fds)
+
+
+async def compare(args: argparse.Namespace) -> None:
+    def file_names() -> list[str]:
+        return [os.path.splitext(os.path.basename(path))[0] for path in session_files(args.workdir)]
+
+    files = await measure(lambda name: FileStorage(name, Path(args.workdir)), file_names)
+    database = await measure(session_db.storage, session_db.names)
+
+    for layout, result in (('Files', files), ('Database', database)):
+        logger.info(f"{layout} | Sessions: <y>{result['sessions']}</y> | Startup: <y>{result['seconds']:.2f}s</y> "
+                    f"| Open files: <y>{result['fds']}</y>")
+
+
+def main() -> None:
+    args = parse_args()
+    command = {'import': import_sessions, 'export': export_sessions, 'compare': compare}[args.command]
+    try:
+        asyncio.run(command(args))
+    finally:
+        session_db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 from .logger import logger
+from . import clock
+from . import metrics
 from . import launcher
 
 
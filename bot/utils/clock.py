@@ -0,0 +1,151 @@
+"""Time source for the bot.
+
+Everything that paces work goes through ``clock.time()`` and ``clock.sleep()``,
+so tests and benchmarks can swap in :class:`VirtualClock` with ``clock.use()``
+and run hours of bot time in seconds. Production uses the real clock.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time as _time
+from contextlib import contextmanager
+
+
+class RealClock:
+    def time(self) -> float:
+        return _time.time()
+
+    async def sleep(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+    def acquire(self) -> None:
+        pass
+
+    def release(self) -> None:
+        pass
+
+
+class VirtualClock:
+    """Clock whose time only moves when every sleeper is waiting.
+
+    ``run()`` must be running as a task: each pass it lets the loop process
+    ready callbacks and I/O, then jumps straight to the earliest pending sleep.
+    Real I/O the loop cannot see as a sleep (a request in flight) is wrapped in
+    ``acquire()``/``release()``, and time stands still until it finishes.
+    """
+
+    def __init__(self, start: float | None = None):
+        self._now = _time.time() if start is None else start
+        self._timers = []
+        self._counter = itertools.count()
+        self._busy = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def time(self) -> float:
+        return self._now
+
+    async def sleep(self, delay: float) -> None:
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        # a delay below the float resolution of epoch seconds must still move time forward
+        wake_at = max(self._now + delay, math.nextafter(self._now, math.inf))
+        heapq.heappush(self._timers, (wake_at, next(self._counter), future))
+        await future
+
+    def acquire(self) -> None:
+        self._busy += 1
+        self._idle.clear()
+
+    def release(self) -> None:
+        self._busy -= 1
+        if not self._busy:
+            self._idle.set()
+
+    def _fire_due(self) -> None:
+        while self._timers and self._timers[0][0] <= self._now:
+            _, _, future = heapq.heappop(self._timers)
+            if not future.done():
+                future.set_result(None)
+
+    async def _settle(self) -> None:
+        """Yields until no other callback is ready, so wake-ups chained through tasks all land first."""
+        ready = getattr(asyncio.get_running_loop(), '_ready', None)
+        for _ in range(1000):
+            await asyncio.sleep(0)
+            if not ready:
+                return
+
+    async def run(self, step: float = 0.0) -> None:
+        while True:
+            await asyncio.sleep(step)
+            await self._idle.wait()
+            await self._settle()
+            if not self._idle.is_set():
+                continue
+
+            while self._timers and self._timers[0][2].done():
+                heapq.heappop(self._timers)
+            if not self._timers:
+                continue
+
+            self._now = max(self._now, self._timers[0][0])
+            self._fire_due()
+
+
+_clock = RealClock()
+
+
+def use(clock) -> None:
+    global _clock
+    _clock = clock
+
+
+def current():
+    return _clock
+
+
+def time() -> float:
+    return _clock.time()
+
+
+async def sleep(delay: float) -> None:
+    await _clock.sleep(delay)
+
+
+@contextmanager
+def hold():
+    """Keeps a virtual clock from moving while the block waits on real I/O."""
+    clock = _clock
+    clock.acquire()
+    try:
+        yield
+    finally:
+        clock.release()
+
+
+async def wait_for(awaitable, timeout: float | None):
+    """``asyncio.wait_for`` measured on this clock, so virtual time can expire it too."""
+    if not timeout:
+        return await awaitable
+
+    task = asyncio.ensure_future(awaitable)
+    timer = asyncio.ensure_future(sleep(timeout))
+    try:
+        await asyncio.wait({task, timer}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        timer.cancel()
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+    if task.cancelled():
+        raise asyncio.TimeoutError()
+    return task.result()
@@ -1,16 +1,26 @@
 import os
 import glob
+import random
 import asyncio
 import argparse
-from itertools import cycle
 
-from pyrogram import Client
 from better_proxy import Proxy
 
 from bot.config import settings
-from bot.utils import logger
-from bot.core.tapper import run_tapper
+from bot.utils import logger, clock, metrics
+from bot.utils.logger import info_rate_limit
+from bot.core.tapper import Tapper, youtube_answer_provider, answers_file
+from bot.core.shared_cache import shared_cache
+from bot.core.scheduler import CycleScheduler
+from bot.core.connections import connectors
+from bot.core.limiter import outbound
+from bot.core.telegram import tg_connections, SessionDescriptor
+from bot.core.ledger import task_ledger
+from bot.core.session_db import session_db
+from bot.core.discovery import ParkedSessions, SessionWatcher, in_shard
 from bot.core.registrator import register_sessions
+from bot.utils.supervisor import Supervisor
+from bot.utils.profiler import profile_window
 
 start_text = """
 
@@ -29,8 +39,13 @@ Select an action:
 
 global tg_clients
 
+PROXIES_FILE = "bot/config/proxies.txt"
+
 
 def get_session_names() -> list[str]:
+    if settings.SESSION_STORAGE == 'database':
+        return session_db.names()
+
     session_names = sorted(glob.glob("sessions/*.session"))
     session_names = [
         os.path.splitext(os.path.basename(file))[0] for file in session_names
@@ -39,37 +54,39 @@ def get_session_names() -> list[str]:
     return session_names
 
 
+def parse_shard(shard: str | None) -> tuple[int, int]:
+    """'2/4' -> (2, 4): this worker runs the third of four stable slices of the sessions."""
+    if not shard:
+        return 0, 1
+    index, workers = (int(part) for part in shard.split('/'))
+    return index, workers
+
+
 def get_proxies() -> list[Proxy]:
     if settings.USE_PROXY_FROM_FILE:
-        with open(file="bot/config/proxies.txt", encoding="utf-8-sig") as file:
-            proxies = [Proxy.from_str(proxy=row.strip()).as_url for row in file]
+        with open(file=PROXIES_FILE, encoding="utf-8-sig") as file:
+            proxies = [Proxy.from_str(proxy=row.strip()).as_url for row in file if row.strip()]
     else:
         proxies = []
 
     return proxies
 
 
-async def get_tg_clients() -> list[Client]:
+async def get_tg_clients(shard: str | None = None) -> list[SessionDescriptor]:
     global tg_clients
 
-    session_names = get_session_names()
+    index, workers = parse_shard(shard)
+    parked = ParkedSessions(settings.PARKED_SESSIONS_FILE)
+    session_names = [session_name for session_name in get_session_names()
+                     if in_shard(session_name, index, workers) and not parked.is_parked(session_name)]
 
-    if not session_names:
+    if not session_names and not settings.SESSION_WATCH_INTERVAL:
         raise FileNotFoundError("Not found session files")
 
     if not settings.API_ID or not settings.API_HASH:
         raise ValueError("API_ID and API_HASH not found in the .env file.")
 
-    tg_clients = [
-        Client(
-            name=session_name,
-            api_id=settings.API_ID,
-            api_hash=settings.API_HASH,
-            workdir="sessions/",
-            plugins=dict(root="bot/plugins"),
-        )
-        for session_name in session_names
-    ]
+    tg_clients = [SessionDescriptor(name=session_name, workdir="sessions/") for session_name in session_names]
 
     return tg_clients
 
@@ -77,10 +94,19 @@ async def get_tg_clients() -> list[Client]:
 async def process() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("-a", "--action", type=int, help="Action to perform")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes for the clicker")
+    parser.add_argument("--profile", type=float, nargs='?', const=60, metavar="SECONDS",
+                        help="Profile the event loop for SECONDS (default 60) and write the results to PROFILE_DIR")
+    parser.add_argument("--profile-delay", type=float, default=0, metavar="SECONDS",
+                        help="Wait this long after start before profiling")
+    parser.add_argument("--shard", help=argparse.SUPPRESS)
 
     logger.info(f"Detected {len(get_session_names())} sessions | {len(get_proxies())} proxies")
 
-    action = parser.parse_args().action
+    args = parser.parse_args()
+    action = args.action
+    if args.workers > 1 and os.name == 'nt':
+        parser.error("--workers is not supported on Windows, run the clicker in one process or under WSL")
 
     if not action:
         logger.info(start_text)
@@ -96,10 +122,13 @@ async def process() -> None:
                 action = int(action)
                 break
 
-    if action == 1:
-        tg_clients = await get_tg_clients()
+    if action == 1 and args.workers > 1 and not args.shard:
+        await Supervisor(workers=args.workers, profile=args.profile, profile_delay=args.profile_delay).run()
 
-        await run_tasks(tg_clients=tg_clients)
+    elif action == 1:
+        tg_clients = await get_tg_clients(shard=args.shard)
+
+        await run_tasks(tg_clients=tg_clients, shard=args.shard, profile=args.profile, profile_delay=args.profile_delay)
 
     elif action == 2:
         await register_sessions()
@@ -107,17 +136,93 @@ async def process() -> None:
 
 
 
-async def run_tasks(tg_clients: list[Client]):
+def proxy_for(position: int, proxies: list[str]) -> str | None:
+    """Same proxy a single process would give the session at ``position`` among all sessions."""
+    return proxies[position % len(proxies)] if proxies else None
+
+
+async def run_tasks(tg_clients: list[SessionDescriptor], shard: str | None = None,
+                    profile: float | None = None, profile_delay: float = 0):
     proxies = get_proxies()
-    proxies_cycle = cycle(proxies) if proxies else None
-    tasks = [
-        asyncio.create_task(
-            run_tapper(
-                tg_client=tg_client,
-                proxy=next(proxies_cycle) if proxies_cycle else None,
-            )
-        )
+    positions = {session_name: position for position, session_name in enumerate(get_session_names())}
+    tappers = [
+        Tapper(tg_client=tg_client, proxy=proxy_for(positions.get(tg_client.name, 0), proxies))
         for tg_client in tg_clients
     ]
 
-    await asyncio.gather(*tasks)
+    scheduler = CycleScheduler(
+        tappers=tappers,
+        max_concurrent=settings.MAX_CONCURRENT_CYCLES,
+        state_file=settings.SCHEDULE_FILE,
+    )
+    parked = ParkedSessions(settings.PARKED_SESSIONS_FILE)
+    scheduler.on_invalid_session = lambda session_name: parked.park(session_name, 'Invalid session')
+
+    def create_tapper(session_name: str, position: int) -> Tapper:
+        return Tapper(tg_client=SessionDescriptor(name=session_name, workdir="sessions/"),
+                      proxy=proxy_for(position, proxies))
+
+    def reload_proxies() -> None:
+        proxies[:] = get_proxies()
+        logger.info(f"Proxies reloaded | <y>{len(proxies)}</y> proxies, used for new sessions")
+
+    watcher = SessionWatcher(scheduler, get_session_names, create_tapper, parked, shard=parse_shard(shard),
+                             proxies_path=PROXIES_FILE if settings.USE_PROXY_FROM_FILE else None,
+                             load_proxies=reload_proxies)
+
+    def wake_puzzle_sessions(answers) -> None:
+        now = clock.time()
+        woken = 0
+        for tapper in scheduler.tappers.values():
+            if tapper.puzzle_pending():
+                due = now + random.randint(0, settings.PUZZLE_WAKE_SPREAD)
+                woken += scheduler.wake(tapper.session_name, due)
+        if woken:
+            logger.info(f"New puzzle | <y>{woken}</y> sessions will solve it within {settings.PUZZLE_WAKE_SPREAD}s")
+
+    loop_lag = metrics.LoopLagMonitor()
+
+    def status() -> dict:
+        return dict(
+            time=clock.time(),
+            rss_bytes=metrics.rss_bytes(),
+            loop_lag=loop_lag.stats(),
+            http_connections=connectors.open_connections(),
+            http_in_flight=int(sum(metrics.http_in_flight.values.values())),
+            http_queued=outbound.queued(),
+            tg_connected=tg_connections.connected,
+            tg_in_flight=int(sum(metrics.tg_in_flight.values.values())),
+            **scheduler.status(),
+        )
+
+    answers_file.subscribe(wake_puzzle_sessions)
+    background = [asyncio.create_task(connectors.report_periodically()), asyncio.create_task(loop_lag.run())]
+    if settings.METRICS_LOG_INTERVAL:
+        background.append(asyncio.create_task(metrics.log_periodically()))
+    if settings.SESSION_WATCH_INTERVAL:
+        scheduler.persistent = True
+        background.append(asyncio.create_task(watcher.watch()))
+    if profile:
+        background.append(asyncio.create_task(profile_window(profile, delay=profile_delay)))
+    metrics_runner = await metrics.serve(status=status) if settings.METRICS_PORT else None
+
+    try:
+        await scheduler.run()
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        for tapper in list(scheduler.tappers.values()):
+            await tapper.close()
+        connectors.log_stats()
+        logger.info(f"YouTube answers cache | {youtube_answer_provider.stats()}")
+        logger.info(f"Shared response cache | {shared_cache.stats()}")
+        await connectors.close()
+        await tg_connections.close()
+        task_ledger.close()
+        session_db.close()
+        if info_rate_limit and info_rate_limit.suppressed:
+            logger.info(f"Log rate limit | Suppressed <y>{info_rate_limit.suppressed}</y> info messages")
+        await logger.complete()
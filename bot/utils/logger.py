@@ -1,9 +1,146 @@
+import json
+import os
 import sys
+import threading
+import time
+from collections import OrderedDict
+
 from loguru import logger
 
+from bot.config import settings
+
+
+TEXT_FORMAT = ("<white>{time:YYYY-MM-DD HH:mm:ss}</white>"
+               " | <level>{level}</level>"
+               " | <white><b>{message}</b></white>")
+FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+
+
+def _json_format(record) -> str:
+    entry = {
+        'time': record['time'].isoformat(),
+        'level': record['level'].name,
+        'message': record['message'],
+        **{key: value for key, value in record['extra'].items() if not key.startswith('_')},
+    }
+    if record['exception']:
+        entry['exception'] = repr(record['exception'].value)
+    record['extra']['_json'] = json.dumps(entry, default=str, ensure_ascii=False)
+    return "{extra[_json]}\n"
+
+
+class InfoRateLimit:
+    """Token bucket per session for INFO messages; warnings and errors always pass."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, record) -> bool:
+        session = record['extra'].get('session')
+        if session is None or record['level'].name != 'INFO':
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self.buckets.get(session, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[session] = (tokens, now)
+                self.suppressed += 1
+                return False
+            self.buckets[session] = (tokens - 1, now)
+            return True
+
+
+class SessionFiles:
+    """One sink that writes every record bound to a session into that session's own file.
+
+    Files are rotated at ``max_bytes`` keeping ``backups`` old copies, and at most
+    ``max_open`` of them are kept open.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, backups: int, max_open: int = 128):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_open = max_open
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session: str) -> str:
+        return os.path.join(self.directory, f"{session}.log")
+
+    def _open(self, session: str):
+        file = self._files.pop(session, None)
+        if file is None:
+            if len(self._files) >= self.max_open:
+                self._files.popitem(last=False)[1].close()
+            file = open(self._path(session), 'a', encoding='utf-8')
+        self._files[session] = file
+        return file
+
+    def _rotate(self, session: str) -> None:
+        self._files.pop(session).close()
+        path = self._path(session)
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{index}"):
+                os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+        if self.backups:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def write(self, message) -> None:
+        session = message.record['extra'].get('session')
+        if session is None:
+            return
+
+        with self._lock:
+            file = self._open(session)
+            file.write(message)
+            file.flush()
+            if self.max_bytes and file.tell() >= self.max_bytes:
+                self._rotate(session)
+
+    def stop(self) -> None:
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+
+
+info_rate_limit = None
+
+
+def setup() -> None:
+    """(Re)configures the sinks from LOG_* settings."""
+    global info_rate_limit
+
+    logger.remove()
+    json_output = settings.LOG_FORMAT == 'json'
+    info_rate_limit = InfoRateLimit(settings.LOG_INFO_RATE, settings.LOG_INFO_BURST) if settings.LOG_INFO_RATE else None
+
+    logger.add(sink=sys.stdout,
+               format=_json_format if json_output else TEXT_FORMAT,
+               level=settings.LOG_LEVEL,
+               filter=info_rate_limit,
+               enqueue=settings.LOG_ENQUEUE)
+
+    if settings.LOG_SESSION_DIR:
+        session_files = SessionFiles(settings.LOG_SESSION_DIR, settings.LOG_SESSION_MAX_BYTES,
+                                     settings.LOG_SESSION_BACKUPS)
+        logger.add(sink=session_files.write,
+                   format=_json_format if json_output else FILE_FORMAT,
+                   level=settings.LOG_LEVEL,
+                   filter=lambda record: 'session' in record['extra'],
+                   colorize=False,
+                   enqueue=settings.LOG_ENQUEUE)
+
 
-logger.remove()
-logger.add(sink=sys.stdout, format="<white>{time:YYYY-MM-DD HH:mm:ss}</white>"
-                                   " | <level>{level}</level>"
-                                   " | <white><b>{message}</b></white>")
+setup()
 logger = logger.opt(colors=True)
@@ -0,0 +1,348 @@
+"""Process-wide counters, gauges and histograms in Prometheus text format.
+
+Updating a metric is a dict lookup and an addition, cheap enough to leave on
+for every request of every session.
+"""
+import asyncio
+import bisect
+import json
+import os
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from bot.config import settings
+from bot.utils import logger, clock
+
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+
+    def _format_labels(self, values: tuple, extra: str = '') -> str:
+        pairs = [f'{label}="{value}"' for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{self._format_labels(labels)} {value}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels: tuple = (), value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, labels: tuple = (), value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def dec(self, labels: tuple = (), value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - value
+
+    def set(self, labels: tuple = (), value: float = 0) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, labels: tuple, value: float) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            # one slot per bucket plus +Inf, then sum
+            state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def count(self) -> int:
+        return sum(sum(state[:-1]) for state in self.values.values())
+
+    def quantile(self, q: float, labels: tuple | None = None) -> float:
+        """Upper bound of the bucket holding the q-quantile (over all labels if none given)."""
+        states = [self.values[labels]] if labels is not None else list(self.values.values())
+        counts = [sum(state[index] for state in states) for index in range(len(self.buckets) + 1)]
+        total = sum(counts)
+        if not total:
+            return 0.0
+
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= q * total:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def samples(self):
+        for labels, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), state[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{self._format_labels(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(labels)} {state[-1]}"
+            yield f"{self.name}_count{self._format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    'majorbot_http_request_duration_seconds', 'Major API request latency', ('endpoint', 'method'))
+http_responses = registry.counter(
+    'majorbot_http_responses_total', 'Major API responses by status code', ('endpoint', 'method', 'status'))
+http_errors = registry.counter(
+    'majorbot_http_errors_total', 'Major API request failures by exception class', ('endpoint', 'method', 'error'))
+http_in_flight = registry.gauge(
+    'majorbot_http_in_flight', 'Major API requests in progress', ('endpoint',))
+
+tg_call_duration = registry.histogram(
+    'majorbot_tg_call_duration_seconds', 'Telegram call latency', ('method',))
+tg_errors = registry.counter(
+    'majorbot_tg_errors_total', 'Telegram call failures by exception class', ('method', 'error'))
+tg_in_flight = registry.gauge(
+    'majorbot_tg_in_flight', 'Telegram calls in progress', ('method',))
+tg_call_rate = registry.gauge(
+    'majorbot_tg_call_rate', 'Shared Telegram call rate limit, calls per second')
+tg_flood_waits = registry.counter(
+    'majorbot_tg_flood_waits_total', 'FloodWait errors reported by any session')
+
+http_queue_depth = registry.gauge(
+    'majorbot_http_queue_depth', 'Requests waiting for a host or proxy slot', ('limiter',))
+http_queue_wait = registry.histogram(
+    'majorbot_http_queue_wait_seconds', 'Time requests waited for a host or proxy slot', ('limiter',))
+
+http_retries = registry.counter(
+    'majorbot_http_retries_total', 'Major API request retries', ('endpoint',))
+circuit_open = registry.gauge(
+    'majorbot_circuit_open', 'Circuit breakers currently open (1) or closed (0)', ('key',))
+
+shared_cache_requests = registry.counter(
+    'majorbot_shared_cache_requests_total', 'Shared response cache lookups by result', ('endpoint', 'result'))
+
+event_loop_lag = registry.gauge(
+    'majorbot_event_loop_lag_seconds', 'Delay of the last event loop lag probe')
+
+stage_duration = registry.histogram(
+    'majorbot_stage_duration_seconds', 'Time spent in each cycle stage', ('stage',), buckets=STAGE_BUCKETS)
+stage_runs = registry.counter(
+    'majorbot_stage_runs_total', 'Cycle stages by outcome', ('stage', 'outcome'))
+
+handler_errors = registry.counter(
+    'majorbot_handler_errors_total', 'Exceptions swallowed by error_handler', ('function', 'error'))
+
+
+_ID_SEGMENT = re.compile(r'/-?\d+(?=/|$)')
+
+
+def endpoint_label(endpoint: str | None, url: str | None = None) -> str:
+    """'/squads/123?' -> '/squads/{id}', full URLs are reduced to their host."""
+    if endpoint is None:
+        return url.split('/')[2] if url and '//' in url else 'unknown'
+    return _ID_SEGMENT.sub('/{id}', endpoint.split('?')[0])
+
+
+@contextmanager
+def track(histogram: Histogram, errors: Counter, in_flight: Gauge, labels: tuple, flight_labels: tuple):
+    started = time.perf_counter()
+    in_flight.inc(flight_labels)
+    try:
+        yield
+    except BaseException as error:
+        errors.inc((*labels, type(error).__name__))
+        raise
+    finally:
+        in_flight.dec(flight_labels)
+        histogram.observe(labels, time.perf_counter() - started)
+
+
+def track_tg(method: str):
+    return track(tg_call_duration, tg_errors, tg_in_flight, (method,), (method,))
+
+
+class LoopLagMonitor:
+    """Measures how late a ``interval`` sleep wakes up, i.e. how busy the event loop is."""
+
+    def __init__(self, interval: float = 0.1, history: int | None = 600):
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.samples.append(lag)
+            event_loop_lag.set(value=lag)
+
+    def stats(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return dict(p50=0.0, p99=0.0, max=0.0)
+        return dict(p50=samples[len(samples) // 2], p99=samples[int(len(samples) * 0.99)], max=samples[-1])
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        # Windows has neither /proc nor resource
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summary() -> str:
+    responses = http_responses.values
+    total = sum(responses.values())
+    throttled = sum(value for labels, value in responses.items() if labels[2] == '429')
+    server_errors = sum(value for labels, value in responses.items() if labels[2].startswith('5'))
+    return (f"Requests: <y>{int(total)}</y> | Failures: <y>{int(http_errors.total())}</y> "
+            f"| 429: <y>{int(throttled)}</y> | 5xx: <y>{int(server_errors)}</y> "
+            f"| p50/p99: <y>{http_request_duration.quantile(0.5)}/{http_request_duration.quantile(0.99)}s</y> "
+            f"| Telegram calls: <y>{tg_call_duration.count()}</y> "
+            f"| Telegram failures: <y>{int(tg_errors.total())}</y> "
+            f"| Shared cache hits: <y>{int(sum(value for labels, value in shared_cache_requests.values.items() if labels[1] != 'miss'))}</y> "
+            f"| Stage time: <y>{stage_breakdown()}</y>")
+
+
+def stage_breakdown(limit: int = 4) -> str:
+    """Stages taking the most cycle time, with their share of it."""
+    totals = {labels[0]: state[-1] for labels, state in stage_duration.values.items()}
+    total = sum(totals.values())
+    if not total:
+        return '-'
+    slowest = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return ', '.join(f"{stage} {seconds / total:.0%}" for stage, seconds in slowest)
+
+
+async def log_periodically() -> None:
+    while True:
+        await clock.sleep(settings.METRICS_LOG_INTERVAL)
+        logger.info(f"Metrics | {summary()}")
+
+
+def _with_shard(series: str, shard: int) -> str:
+    name, brace, labels = series.partition('{')
+    return f'{name}{{shard="{shard}"{"," + labels if brace else "}"}'
+
+
+def merge(texts: list[str]) -> str:
+    """Combines several /metrics pages, one per worker.
+
+    Counters and histograms are summed. Gauges describe one process (loop lag,
+    call rate, open circuits), so each worker's series is kept with a ``shard`` label.
+    """
+    families = {}
+    for shard, text in enumerate(texts):
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# HELP '):
+                family = families.setdefault(line.split(' ')[2], dict(comments=[], samples={}, gauge=False))
+            if line.startswith('# TYPE ') and family is not None:
+                family['gauge'] = line.split(' ')[3] == 'gauge'
+            if line.startswith('#'):
+                if line not in family['comments']:
+                    family['comments'].append(line)
+            elif line and family is not None:
+                series, _, value = line.rpartition(' ')
+                if family['gauge']:
+                    series = _with_shard(series, shard)
+                family['samples'][series] = family['samples'].get(series, 0.0) + float(value)
+
+    lines = []
+    for family in families.values():
+        lines.extend(family['comments'])
+        lines.extend(f"{series} {int(value) if value.is_integer() else value}"
+                     for series, value in family['samples'].items())
+    return '\n'.join(lines) + '\n'
+
+
+async def serve(render=None, status=None) -> web.AppRunner:
+    """Starts the local /metrics (and /status, if given) endpoints on METRICS_HOST:METRICS_PORT.
+
+    The /status body is built at most once per STATUS_CACHE_TTL seconds however
+    often it is requested.
+    """
+    cached = dict(expires=0.0, body='')
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        text = await render() if render else registry.render()
+        return web.Response(text=text, content_type='text/plain', charset='utf-8')
+
+    async def handle_status(request: web.Request) -> web.Response:
+        if cached['expires'] <= time.monotonic():
+            snapshot = status()
+            if asyncio.iscoroutine(snapshot):
+                snapshot = await snapshot
+            cached['body'] = json.dumps(snapshot)
+            cached['expires'] = time.monotonic() + settings.STATUS_CACHE_TTL
+        return web.Response(text=cached['body'], content_type='application/json')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    if status:
+        app.router.add_get('/status', handle_status)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.METRICS_HOST, settings.METRICS_PORT).start()
+    logger.info(f"Metrics available at <y>http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics</y>"
+                + (", status at <y>/status</y>" if status else ''))
+    return runner
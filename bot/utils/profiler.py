@@ -0,0 +1,191 @@
+"""Sampling profiler for the event loop thread (``main.py --profile``).
+
+A background thread looks at the loop thread's stack every PROFILE_INTERVAL
+seconds. Each sample is charged the wall time since the previous one and, where
+the OS exposes per-thread CPU clocks, the CPU time the loop thread used in
+between. Blocking calls on the loop (file I/O, sqlite, DNS) show up as wall time
+with little CPU; JSON decoding, log formatting, TLS and crypto show up as both.
+
+Results are written as collapsed stacks (``flamegraph.pl``, speedscope,
+inferno) and as a top-N report grouped by Tapper method.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from bot.config import settings
+from bot.utils import logger
+
+
+OUTSIDE_TAPPER = '(outside Tapper)'
+_IDLE_FUNCTIONS = {('selectors.py', 'select'), ('selectors.py', 'poll')}
+
+
+def _short_path(path: str) -> str:
+    cwd = os.getcwd() + os.sep
+    if path.startswith(cwd):
+        return path[len(cwd):]
+    parts = path.split(os.sep)
+    return os.sep.join(parts[-2:])
+
+
+class Profiler:
+    def __init__(self, interval: float | None = None):
+        self.interval = interval or settings.PROFILE_INTERVAL
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.samples = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._labels = {}
+        self._thread_id = None
+        self._cpu_clock = None
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = self._labels[code] = f"{name} ({_short_path(code.co_filename)})"
+        return label
+
+    def _stack(self, frame) -> tuple:
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _cpu_time(self) -> float | None:
+        if self._cpu_clock is None:
+            return None
+        try:
+            return time.clock_gettime(self._cpu_clock)
+        except OSError:
+            return None
+
+    def _sample(self) -> None:
+        last_wall = time.perf_counter()
+        last_cpu = self._cpu_time()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            now_wall = time.perf_counter()
+            now_cpu = self._cpu_time()
+            if frame is None:
+                break
+
+            stack = self._stack(frame)
+            self.wall[stack] += now_wall - last_wall
+            if now_cpu is not None and last_cpu is not None:
+                self.cpu[stack] += now_cpu - last_cpu
+            self.samples += 1
+            last_wall, last_cpu = now_wall, now_cpu
+
+    def start(self) -> None:
+        """Starts sampling the calling thread, which should be the one running the event loop."""
+        self._thread_id = threading.get_ident()
+        try:
+            self._cpu_clock = time.pthread_getcpuclockid(self._thread_id)
+        except (AttributeError, OSError):
+            self._cpu_clock = None
+        self.started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+
+    @staticmethod
+    def _is_idle(stack: tuple) -> bool:
+        leaf = stack[-1]
+        return (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_FUNCTIONS
+
+    @staticmethod
+    def _tapper_method(stack: tuple) -> str:
+        """Innermost Tapper method on the stack; nested functions count towards the method they are in."""
+        for code in reversed(stack):
+            name = getattr(code, 'co_qualname', code.co_name)
+            if name.startswith('Tapper.') and code.co_filename.endswith(os.path.join('core', 'tapper.py')):
+                return '.'.join(name.split('.')[:2])
+        return OUTSIDE_TAPPER
+
+    def collapsed(self, weights: dict) -> list[str]:
+        """One ``frame;frame;frame value`` line per stack, values in microseconds."""
+        lines = []
+        for stack, seconds in weights.items():
+            value = int(seconds * 1_000_000)
+            if value > 0:
+                lines.append(f"{';'.join(self._label(code) for code in stack)} {value}")
+        return sorted(lines)
+
+    def report(self, top: int | None = None) -> list[str]:
+        top = top or settings.PROFILE_TOP
+        total_wall = sum(self.wall.values()) or 1e-9
+        has_cpu = bool(self.cpu)
+        idle = sum(seconds for stack, seconds in self.wall.items() if self._is_idle(stack))
+        total_cpu = sum(self.cpu.values())
+
+        methods_wall, methods_cpu = defaultdict(float), defaultdict(float)
+        functions_wall, functions_cpu = defaultdict(float), defaultdict(float)
+        for stack, seconds in self.wall.items():
+            if self._is_idle(stack):
+                continue
+            method = self._tapper_method(stack)
+            leaf = self._label(stack[-1])
+            methods_wall[method] += seconds
+            functions_wall[leaf] += seconds
+            methods_cpu[method] += self.cpu.get(stack, 0.0)
+            functions_cpu[leaf] += self.cpu.get(stack, 0.0)
+
+        lines = [f"Profile | {self.elapsed:.1f}s | Samples: {self.samples} | Loop busy: {1 - idle / total_wall:.0%}"
+                 + (f" | Loop CPU: {total_cpu / (self.elapsed or 1e-9):.0%}" if has_cpu else " | CPU: unavailable")]
+
+        def table(title: str, wall: dict, cpu: dict) -> None:
+            lines.append(f"{title:<60} {'wall %':>7} {'wall s':>8} {'CPU s':>8}")
+            for name, seconds in sorted(wall.items(), key=lambda item: item[1], reverse=True)[:top]:
+                cpu_text = f"{cpu[name]:8.2f}" if has_cpu else f"{'-':>8}"
+                lines.append(f"{name[:60]:<60} {seconds / total_wall:7.1%} {seconds:8.2f} {cpu_text}")
+
+        table('Tapper method (innermost on the stack)', methods_wall, methods_cpu)
+        table('Function (self time)', functions_wall, functions_cpu)
+        return lines
+
+    def write(self, directory: str | None = None) -> list[str]:
+        directory = directory or settings.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+
+        outputs = {f"{prefix}.wall.collapsed": self.collapsed(self.wall),
+                   f"{prefix}.txt": self.report()}
+        if self.cpu:
+            outputs[f"{prefix}.cpu.collapsed"] = self.collapsed(self.cpu)
+
+        for path, lines in outputs.items():
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+        return list(outputs)
+
+
+async def profile_window(seconds: float, delay: float = 0) -> None:
+    """Profiles the event loop for ``seconds`` after ``delay``, then writes the results to PROFILE_DIR."""
+    await asyncio.sleep(delay)
+    profiler = Profiler()
+    profiler.start()
+    logger.info(f"Profiler | Sampling the event loop every <y>{profiler.interval * 1000:.0f} ms</y> for <y>{seconds}s</y>")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        paths = profiler.write()
+        for line in profiler.report():
+            logger.opt(colors=False).info(line)
+        logger.info(f"Profiler | Written <y>{', '.join(paths)}</y>")
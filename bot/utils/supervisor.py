@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+
+from bot.config import settings
+from bot.utils import logger, metrics
+
+
+def shard_env(index: int) -> dict:
+    """Settings overridden for one worker: its own schedule file and metrics port."""
+    root, ext = os.path.splitext(settings.SCHEDULE_FILE)
+    env = dict(os.environ, SCHEDULE_FILE=f"{root}.{index}{ext}")
+    if settings.METRICS_PORT:
+        env['METRICS_PORT'] = str(settings.METRICS_PORT + 1 + index)
+    return env
+
+
+class Supervisor:
+    """Runs ``main.py -a 1`` in ``workers`` processes, each with a stable share of the sessions.
+
+    Workers that crash are restarted after WORKER_RESTART_DELAY seconds (doubled on
+    each crash in a row, up to 5 minutes). SIGINT/SIGTERM are forwarded as SIGINT
+    so every worker shuts down gracefully; workers still running after
+    WORKER_SHUTDOWN_TIMEOUT are killed. With METRICS_PORT set, the parent serves
+    all workers' metrics on that port (counters summed, gauges per shard).
+    ``--profile`` is passed on, so every worker writes its own profile.
+
+    POSIX only: it relies on loop signal handlers and on starting workers in
+    their own session, neither of which exists on Windows.
+    """
+
+    def __init__(self, workers: int, profile: float | None = None, profile_delay: float = 0):
+        self.workers = workers
+        self.profile = profile
+        self.profile_delay = profile_delay
+        self.processes = {}
+        self.restarts = 0
+        self.stopping = False
+        self.stopped = asyncio.Event()
+
+    def command(self, index: int) -> list[str]:
+        command = [sys.executable, os.path.abspath(sys.argv[0]), '-a', '1', '--shard', f"{index}/{self.workers}"]
+        if self.profile:
+            command += ['--profile', str(self.profile), '--profile-delay', str(self.profile_delay)]
+        return command
+
+    async def _run_worker(self, index: int) -> None:
+        delay = settings.WORKER_RESTART_DELAY
+        while not self.stopping:
+            started = time.monotonic()
+            # own session: Ctrl+C in the terminal reaches the parent only, which forwards it once
+            process = await asyncio.create_subprocess_exec(*self.command(index), env=shard_env(index),
+                                                           start_new_session=True)
+            self.processes[index] = process
+            logger.info(f"Worker {index + 1}/{self.workers} | Started with pid <y>{process.pid}</y>")
+
+            code = await process.wait()
+            self.processes.pop(index, None)
+            if self.stopping or code == 0:
+                logger.info(f"Worker {index + 1}/{self.workers} | Stopped with code <y>{code}</y>")
+                return
+
+            if time.monotonic() - started > 60:
+                delay = settings.WORKER_RESTART_DELAY
+            self.restarts += 1
+            logger.warning(f"Worker {index + 1}/{self.workers} | Exited with code <y>{code}</y>, "
+                           f"restarting in {delay}s")
+            try:
+                await asyncio.wait_for(self.stopped.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, 300)
+
+    def stop(self) -> None:
+        if self.stopping:
+            return
+
+        self.stopping = True
+        self.stopped.set()
+        logger.info(f"Stopping <y>{len(self.processes)}</y> workers")
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGINT)
+
+    async def _kill_after_timeout(self) -> None:
+        await self.stopped.wait()
+        await asyncio.sleep(settings.WORKER_SHUTDOWN_TIMEOUT)
+        for index, process in self.processes.items():
+            if process.returncode is None:
+                logger.warning(f"Worker {index + 1}/{self.workers} | Did not stop in time, killing")
+                process.kill()
+
+    async def _fetch_all(self, path: str) -> list[str]:
+        async def fetch(session: aiohttp.ClientSession, index: int) -> str:
+            url = f"http://{settings.METRICS_HOST}:{settings.METRICS_PORT + 1 + index}{path}"
+            try:
+                async with session.get(url) as response:
+                    return await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return ''
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            return list(await asyncio.gather(*(fetch(session, index) for index in range(self.workers))))
+
+    async def render_metrics(self) -> str:
+        return metrics.merge(await self._fetch_all('/metrics'))
+
+    async def status(self) -> dict:
+        workers = []
+        for index, text in enumerate(await self._fetch_all('/status')):
+            process = self.processes.get(index)
+            worker = dict(worker=index, pid=process.pid if process else None)
+            try:
+                worker.update(json.loads(text))
+            except ValueError:
+                worker['error'] = 'unavailable'
+            workers.append(worker)
+        return dict(restarts=self.restarts, workers=workers)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+
+        metrics_runner = await metrics.serve(self.render_metrics, self.status) if settings.METRICS_PORT else None
+        killer = asyncio.create_task(self._kill_after_timeout())
+        try:
+            await asyncio.gather(*(self._run_worker(index) for index in range(self.workers)))
+        finally:
+            killer.cancel()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+            logger.info(f"All workers stopped | Restarts: <y>{self.restarts}</y>")